@@ -4,11 +4,22 @@ import dash_html_components as html
 import colorlover as cl
 import dash_bootstrap_components as dbc
 from stock_trace import *
-import pandas as pd
+from stock_data import *
+from indicator_cache import cached_trace, indicator_cache
+from downsample import max_points_for_width
+from fast_figure import figure_dict
+from universe import read_universe
+from live import LIVE_INTERVAL, extend_data, live_book
+import metrics
+import warmup
+from shared_store import Loader
+from dash.dependencies import ALL, MATCH
+from dash.exceptions import PreventUpdate
+import collections
 import datetime
+import time
+import functools
 import webbrowser
-pd.core.common.is_list_like = pd.api.types.is_list_like
-from pandas_datareader import data as dr
 
 app = dash.Dash(external_stylesheets=[dbc.themes.BOOTSTRAP],
                 meta_tags=[
@@ -17,6 +28,11 @@ app = dash.Dash(external_stylesheets=[dbc.themes.BOOTSTRAP],
 app.scripts.config.serve_locally = False
 colorscale = cl.scales['9']['qual']['Paired']
 server = app.server
+# callback latency histograms and cache stats on /metrics
+metrics.register(server)
+metrics.registry.cache("indicator", indicator_cache.stats)
+metrics.registry.cache("frames", frame_store.stats)
+metrics.registry.cache("upstream", source.stats)
 
 ### WEB LAYOUT AND COMPONENT ##
 
@@ -71,6 +87,7 @@ sidebar = html.Div(
             dbc.Button("90 Days view", color="primary", id="90d-button", className="time-view", block=True),
             dbc.Button("180 Days view", color="primary", id="180d-button", className="time-view", block=True),
             dbc.Button("Year view", color="primary", id="year-button", className="time-view", block=True),
+            dbc.Button("Live view", color="primary", id="live-button", className="time-view", block=True),
         ], id="time-collapse"),
 
         html.Hr(),
@@ -99,173 +116,153 @@ header = html.Div([
                    })
 ])
 
-STOCKS = pd.read_csv("snp500.csv")
-stock_menu = dcc.Dropdown(
-    id='stock-ticker-input',
-    options=[{'label': s[0], 'value': str(s[1])}
-             for s in zip(STOCKS["Symbol"], STOCKS["Symbol"])],
-    value=['AAPL', 'GOOG'],
-    multi=True
-)
-
-graph_layout = {
-    'margin': {'b': 0, 'r': 10, 'l': 60, 't': 0},
-    'legend': {'x': 0}
-}
-
-app.layout = html.Div([
-    header,
-    stock_menu,
-    sidebar,
-    html.Div(id='graphs')
-], className="container")
-
-
-def get_period_view(stock_name, days):
-    now = datetime.datetime.now()
-    time_delta = datetime.timedelta(days=days)
-    last_week = now - time_delta
-    now = now.strftime("%d/%m/%y")
-    last_week = last_week.strftime("%d/%m/%y")
-    return load_stock(stock_name, last_week, now)
-
+# read on the first page load rather than at import
+@functools.lru_cache(maxsize=None)
+def stock_options():
+    return [{'label': s, 'value': str(s)} for s in read_universe()]
 
-def get_60d_view(stock_name):
-    return get_period_view(stock_name, days=60)
 
+DEFAULT_TICKERS = ['AAPL', 'GOOG']
 
-def get_90d_view(stock_name):
-    return get_period_view(stock_name, days=90)
 
+def build_stock_menu():
+    return dcc.Dropdown(
+        id='stock-ticker-input',
+        options=stock_options(),
+        value=DEFAULT_TICKERS,
+        multi=True
+    )
 
-def get_180d_view(stock_name):
-    return get_period_view(stock_name, days=180)
-
+graph_layout = {
+    'margin': {'b': 0, 'r': 10, 'l': 60, 't': 0},
+    'legend': {'x': 0}
+}
 
-def get_month_view(stock_name):
-    return get_period_view(stock_name, days=30)
+emasma_layout = dict(
+    graph_layout,
+    xaxis={'title': {'text': "SMA"}},
+    yaxis={'title': {'text': "EMA"}},
+    font=dict(
+        family="Courier New, monospace",
+        size=18,
+        color="#7f7f7f"
+    )
+)
 
+# per-session chart and time options, see update_view
+DEFAULT_VIEW = {'chart': 'candlestick_trace', 'time': 'year', 'emasma': False, 'version': 0}
 
-def get_week_view(stock_name):
-    return get_period_view(stock_name, days=7)
+def serve_layout():
+    return html.Div([
+        header,
+        build_stock_menu(),
+        sidebar,
+        html.Div(id='graphs'),
+        dcc.Store(id='view-state', data=DEFAULT_VIEW),
+        dcc.Store(id='overlay-state'),
+        dcc.Store(id='overlay-traces'),
+        dcc.Store(id='overlay-added'),
+        dcc.Store(id='chart-width'),
+        dcc.Interval(id='live-interval', interval=LIVE_INTERVAL, disabled=True),
+        dcc.Store(id='live-cursor')
+    ], className="container")
 
 
-def load_stock(stock_name, start='01/02/2019', end='5/9/2020'):
-    begins = list(map(int, start.split("/")))[::-1]
-    finishs = list(map(int, end.split("/")))[::-1]
-    start = datetime.datetime(*begins)
-    end = datetime.datetime(*finishs)
-    return dr.DataReader(stock_name, 'yahoo', start=start, end=end).reset_index()
+app.layout = serve_layout
 
 
 ####### STUDIES TRACES ######
-draw_func = candlestick_trace
-time_func = load_stock
+CHARTS = {f.__name__: f for f in (candlestick_trace, scatter_trace, OHLC_trace)}
+CHART_BUTTONS = {"candle-button": "candlestick_trace", "scatter-button": "scatter_trace", "OHLC-button": "OHLC_trace"}
+TIME_BUTTONS = {"week-button": "week", "month-button": "month", "60d-button": "60d",
+                "90d-button": "90d", "180d-button": "180d", "year-button": "year"}
+# overlays a figure carries are tagged with meta so the browser can toggle them
+OVERLAY_TRACES = [("MA", "ma-button", moving_average_trace),
+                  ("BB", "bollinger-button", bollinger_trace),
+                  ("EMA", "ema-button", e_moving_average_trace),
+                  ("PP", "pp-button", pp_trace),
+                  ("VWAP", "vwap-button", volume_weighted_average_price_trace)]
+
+
+# downsampling budgets update_figure has drawn at, from the widths browsers report
+drawn_points = collections.Counter()
+
+
+# Load a ticker and build the default view's chart and overlays ahead of its
+# first request, the same cache entries update_figure looks up at the widths
+# graphs are most often drawn at (the default budget until one is seen)
+def warm_ticker(ticker):
+    dff = get_period_view(ticker, VIEW_DAYS[DEFAULT_VIEW['time']])
+    for max_points in [p for p, _ in drawn_points.most_common(2)] or [max_points_for_width(None)]:
+        cached_trace(ticker, dff, CHARTS[DEFAULT_VIEW['chart']], max_points, True)
+        for _, _, func in OVERLAY_TRACES:
+            cached_trace(ticker, dff, func, max_points, True)
+
+
+# background warm-up of default and most viewed tickers, progress on /warmup
+warmer = warmup.Prewarmer(warm_ticker, DEFAULT_TICKERS)
+warmup.register(server, warmer)
+
+# with SHARED_STORE=1 one worker keeps the default tickers and the universe in
+# the shared store for all of them, whether or not the warm-up runs
+shared_loader = None
+if frame_store.shared is not None:
+    shared_loader = Loader(frame_store.load, lambda: DEFAULT_TICKERS + read_universe())
+    metrics.registry.cache("shared", frame_store.shared.stats)
+    server.before_request(shared_loader.start)
+
+
+# Start this process's background threads. gunicorn calls it in each worker
+# as soon as the worker has loaded the app (gunicorn.conf.py), so workers are
+# warm before their first request; under other servers the before_request
+# hooks above start them on the first request instead. Importing the app
+# never starts anything, and starting twice is a no-op.
+def start_background():
+    if warmup.WARMUP_ENABLED:
+        warmer.start()
+    if shared_loader is not None:
+        shared_loader.start()
+
+
+# Chart and time options live in the session's view-state store; every
+# graph redraws from it on its own.
+@app.callback(
+    dash.dependencies.Output('view-state', 'data'),
+    [dash.dependencies.Input(button, "n_clicks")
+     for button in list(CHART_BUTTONS) + list(TIME_BUTTONS) + ["emasma-button", "rule-button"]],
+    [dash.dependencies.State('view-state', 'data')])
+def update_view(*args):
+    view = dict(args[-1] or DEFAULT_VIEW)
+    # get button pressed
+    changed_id = [p['prop_id'] for p in dash.callback_context.triggered][0]
+    button = changed_id.split(".")[0]
+    # if rule:
+    #     webbrowser.open('http://159.138.146.202:8001/')
+    if button in CHART_BUTTONS:
+        view['chart'], view['emasma'] = CHART_BUTTONS[button], False
+    elif button in TIME_BUTTONS:
+        view['time'], view['emasma'] = TIME_BUTTONS[button], False
+    elif button == "emasma-button":
+        view['emasma'] = True
+    else:
+        raise PreventUpdate
+    view['version'] = time.time()
+    return view
 
 
 @app.callback(
-    dash.dependencies.Output('graphs', 'children'), [
-        dash.dependencies.Input('stock-ticker-input', 'value'),
-
-        dash.dependencies.Input("bollinger-button", "n_clicks"),
-        dash.dependencies.Input("ma-button", "n_clicks"),
-        dash.dependencies.Input("ema-button", "n_clicks"),
-        dash.dependencies.Input("pp-button", "n_clicks"),
-        dash.dependencies.Input("vwap-button", "n_clicks"),
-
-        dash.dependencies.Input("candle-button", "n_clicks"),
-        dash.dependencies.Input("scatter-button", "n_clicks"),
-        dash.dependencies.Input("OHLC-button", "n_clicks"),
-
-        dash.dependencies.Input("week-button", "n_clicks"),
-        dash.dependencies.Input("month-button", "n_clicks"),
-        dash.dependencies.Input("60d-button", "n_clicks"),
-        dash.dependencies.Input("90d-button", "n_clicks"),
-        dash.dependencies.Input("180d-button", "n_clicks"),
-        dash.dependencies.Input("year-button", "n_clicks"),
-        dash.dependencies.Input("emasma-button", "n_clicks"),
-        dash.dependencies.Input("rule-button", "n_clicks"),
-    ])
-def update_graph(tickers, bollinger_click, ma_click, ema_click, pp_click, vwap_click,
-                 candle_click, scatter_click, broken_click,
-                 week, month, sixty_days, ninety_days, half_year, year, emasma_click,rule):
+    dash.dependencies.Output('graphs', 'children'),
+    [dash.dependencies.Input('stock-ticker-input', 'value')])
+@metrics.instrument
+def update_graph(tickers):
+    metrics.tickers(len(tickers or []))
     if not tickers:
         return html.H3(
             "Select a stock ticker.",
             style={'marginTop': 20, 'marginBottom': 20})
-    # if rule:
-    #     webbrowser.open('http://159.138.146.202:8001/')
-
-    # get button pressed
-    changed_id = [p['prop_id'] for p in dash.callback_context.triggered][0]
 
-    global draw_func
-    global time_func
     graphs = []
-
-    for i, ticker in enumerate(tickers):
-        if "week-button" in changed_id:
-            time_func = get_week_view
-            dff = time_func(ticker)
-        elif "month-button" in changed_id:
-            time_func = get_month_view
-            dff = time_func(ticker)
-        elif "60d-button" in changed_id:
-            time_func = get_60d_view
-            dff = time_func(ticker)
-        elif "90d-button" in changed_id:
-            time_func = get_90d_view
-            dff = time_func(ticker)
-        elif "180d-button" in changed_id:
-            time_func = get_180d_view
-            dff = time_func(ticker)
-        elif "year-button" in changed_id:
-            time_func = load_stock
-            dff = load_stock(ticker)
-        else:
-            dff = time_func(ticker)
-
-        if "candle-button" in changed_id:
-            draw_func = candlestick_trace
-            fig = go.Figure(data=[candlestick_trace(dff)], layout=graph_layout)
-        elif "scatter-button" in changed_id:
-            draw_func = scatter_trace
-            fig = go.Figure(data=[scatter_trace(dff)], layout=graph_layout)
-        elif "OHLC-button" in changed_id:
-            draw_func = OHLC_trace
-            fig = go.Figure(data=[OHLC_trace(dff)], layout=graph_layout)
-        else:
-            fig = go.Figure(data=[draw_func(dff)], layout=graph_layout)
-
-        # add trace by toggle button
-        if ma_click and ma_click % 2:
-            fig.add_trace(moving_average_trace(df=dff))
-
-        if bollinger_click and bollinger_click % 2:
-            [fig.add_trace(tr) for tr in bollinger_trace(df=dff)]
-
-        if ema_click and ema_click % 2:
-            fig.add_trace(e_moving_average_trace(df=dff))
-
-        if pp_click and pp_click % 2:
-            [fig.add_trace(tr) for tr in pp_trace(df=dff)]
-
-        if vwap_click and vwap_click % 2:
-            fig.add_trace(volume_weighted_average_price_trace(df=dff))
-
-        # override the graph to show indicator feature only
-        if "emasma-button" in changed_id:
-            fig = go.Figure(data=[emasma_trace(dff)], layout=graph_layout)
-            fig.update_layout(
-                xaxis_title="SMA",
-                yaxis_title="EMA",
-                font=dict(
-                    family="Courier New, monospace",
-                    size=18,
-                    color="#7f7f7f"
-                )
-            )
-
+    for ticker in tickers:
         graphs.extend([
             html.H2(ticker, className="stock name",
                     style={
@@ -274,13 +271,164 @@ def update_graph(tickers, bollinger_click, ma_click, ema_click, pp_click, vwap_c
                         'color': "rgba(150, 150, 150, 0.95)"
                     }),
             dcc.Graph(
-                id=ticker,
-                figure=fig
+                id={'type': 'stock-graph', 'ticker': ticker},
+                figure={'data': [], 'layout': graph_layout}
             ), html.Div([html.H2()])])
-
     return graphs
 
 
+# One callback per graph: a ticker is loaded and drawn independently of the
+# others, and only when its graph appears or the view changes.
+@app.callback(
+    dash.dependencies.Output({'type': 'stock-graph', 'ticker': MATCH}, 'figure'),
+    [dash.dependencies.Input({'type': 'stock-graph', 'ticker': MATCH}, 'id'),
+     dash.dependencies.Input('view-state', 'data')],
+    [dash.dependencies.State('chart-width', 'data'),
+     dash.dependencies.State('overlay-state', 'data')])
+@metrics.instrument
+def update_figure(graph_id, view, width, overlays):
+    ticker = graph_id['ticker']
+    metrics.tickers(1)
+    warmer.viewed(ticker)
+    view = view or DEFAULT_VIEW
+    # long ranges are downsampled to about one point per pixel of chart width
+    max_points = max_points_for_width(width)
+    drawn_points[max_points] += 1
+    try:
+        with metrics.stage("fetch"):
+            dff = get_period_view(ticker, VIEW_DAYS[view['time']])
+    except Exception as e:
+        return figure_dict([], dict(graph_layout, annotations=[
+            dict(text="Could not load %s (%s)" % (ticker, e), showarrow=False)]))
+
+    # figures are plain dicts of cached, compacted traces: no graph_objs
+    # validation or copies per callback
+    # override the graph to show indicator feature only
+    if view['emasma']:
+        with metrics.stage("compute"):
+            data = [cached_trace(ticker, dff, emasma_trace, max_points, True)]
+        with metrics.stage("figure"):
+            return figure_dict(data, emasma_layout)
+
+    with metrics.stage("compute"):
+        data = [cached_trace(ticker, dff, CHARTS[view['chart']], max_points, True)]
+        data.extend(overlay_traces(ticker, dff, overlays, max_points))
+    with metrics.stage("figure"):
+        return figure_dict(data, graph_layout)
+
+
+# Trace dicts of the overlays the session has turned on at some point, in
+# OVERLAY_TRACES order; those toggled off again are sent hidden so turning
+# them back on needs no request. The rest are fetched by load_overlays.
+def overlay_traces(ticker, dff, overlays, max_points, keys=None):
+    overlays = overlays or {'visible': {}, 'loaded': []}
+    keys = overlays['loaded'] if keys is None else keys
+    data = []
+    for key, _, func in OVERLAY_TRACES:
+        if key not in keys:
+            continue
+        traces = cached_trace(ticker, dff, func, max_points, True)
+        for trace in traces if isinstance(traces, list) else [traces]:
+            data.append(dict(trace, meta=key, visible=overlays['visible'].get(key, False)))
+    return data
+
+
+# Width available to the graphs, read in the browser (assets/clientside.js)
+app.clientside_callback(
+    dash.dependencies.ClientsideFunction(namespace='stock', function_name='chart_width'),
+    dash.dependencies.Output('chart-width', 'data'),
+    [dash.dependencies.Input('stock-ticker-input', 'value')])
+
+
+# Overlay toggles flip the visibility of traces the graphs already have in the
+# browser, and list the overlays turned on for the first time (assets/clientside.js)
+app.clientside_callback(
+    dash.dependencies.ClientsideFunction(namespace='stock', function_name='toggle_overlays'),
+    dash.dependencies.Output('overlay-state', 'data'),
+    [dash.dependencies.Input(button, "n_clicks") for _, button, _ in OVERLAY_TRACES],
+    [dash.dependencies.State('overlay-state', 'data')])
+
+
+# Traces of the overlays just turned on for the first time, for every graph
+@app.callback(
+    dash.dependencies.Output('overlay-traces', 'data'),
+    [dash.dependencies.Input('overlay-state', 'data')],
+    [dash.dependencies.State('view-state', 'data'),
+     dash.dependencies.State('chart-width', 'data'),
+     dash.dependencies.State({'type': 'stock-graph', 'ticker': ALL}, 'id')])
+@metrics.instrument
+def load_overlays(overlays, view, width, graph_ids):
+    view = view or DEFAULT_VIEW
+    added = (overlays or {}).get('added')
+    if not added or view['emasma'] or not graph_ids:
+        raise PreventUpdate
+    metrics.tickers(len(graph_ids))
+    max_points = max_points_for_width(width)
+    traces = {}
+    for graph_id in graph_ids:
+        ticker = graph_id['ticker']
+        try:
+            with metrics.stage("fetch"):
+                dff = get_period_view(ticker, VIEW_DAYS[view['time']])
+        except Exception:
+            continue
+        with metrics.stage("compute"):
+            traces[ticker] = overlay_traces(ticker, dff, overlays, max_points, added)
+    return traces
+
+
+# ... and adds them to the graphs in place (assets/clientside.js)
+app.clientside_callback(
+    dash.dependencies.ClientsideFunction(namespace='stock', function_name='add_overlays'),
+    dash.dependencies.Output('overlay-added', 'data'),
+    [dash.dependencies.Input('overlay-traces', 'data')])
+
+
+@app.callback(
+    dash.dependencies.Output("live-interval", "disabled"),
+    [dash.dependencies.Input("live-button", "n_clicks")],
+)
+def live_toggle(n):
+    return not (n and n % 2)
+
+
+# Live mode: append the bars that arrived since the last refresh to every
+# graph, instead of rebuilding the figures.
+@app.callback(
+    [dash.dependencies.Output({'type': 'stock-graph', 'ticker': ALL}, 'extendData'),
+     dash.dependencies.Output('live-cursor', 'data')],
+    [dash.dependencies.Input('live-interval', 'n_intervals')],
+    [dash.dependencies.State('view-state', 'data'),
+     dash.dependencies.State('overlay-state', 'data'),
+     dash.dependencies.State('live-cursor', 'data'),
+     dash.dependencies.State({'type': 'stock-graph', 'ticker': ALL}, 'id')],
+)
+@metrics.instrument
+def live_update(n_intervals, view, overlay_state, cursor, graph_ids):
+    metrics.tickers(len(graph_ids or []))
+    view = view or DEFAULT_VIEW
+    # the EMA/SMA view has no time axis to extend
+    if view['emasma'] or not graph_ids:
+        raise PreventUpdate
+    # a redrawn figure lost its live points, so resend the buffered ones
+    version = "%s|%s" % (view['version'], ",".join(g['ticker'] for g in graph_ids))
+    since = cursor['since'] if cursor and cursor['version'] == version else {}
+    # the graphs carry the overlays turned on so far, see overlay_traces
+    overlays = (overlay_state or {}).get('loaded', [])
+    updates = []
+    for graph_id in graph_ids:
+        ticker = graph_id['ticker']
+        last = since.get(ticker)
+        with metrics.stage("fetch"):
+            entries = live_book.bars_since(ticker, datetime.datetime.fromisoformat(last) if last else None)
+        if not entries:
+            updates.append(dash.no_update)
+            continue
+        with metrics.stage("figure"):
+            updates.append(extend_data(entries, view['chart'], overlays))
+        since[ticker] = entries[-1][0]['Date'].isoformat()
+    return updates, {'version': version, 'since': since}
+
 
 @app.callback(
     dash.dependencies.Output("time-collapse", "is_open"),
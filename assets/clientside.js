@@ -0,0 +1,71 @@
+// overlay metas in the order app.OVERLAY_TRACES adds them
+var OVERLAY_KEYS = ["MA", "BB", "EMA", "PP", "VWAP"];
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    stock: {
+        // Pixel width the stock graphs get, used to size server-side downsampling
+        chart_width: function () {
+            var graphs = document.getElementById("graphs");
+            return (graphs && graphs.clientWidth) || window.innerWidth;
+        },
+
+        // Show or hide the overlay traces (tagged with meta) on every rendered
+        // graph; arguments are the n_clicks of the overlay toggle buttons and
+        // the previous state. Overlays turned on for the first time are listed
+        // in "added" for the server to send (see add_overlays).
+        toggle_overlays: function () {
+            var keys = OVERLAY_KEYS;
+            var state = arguments[keys.length] || {};
+            var visible = {}, loaded = (state.loaded || []).slice(), added = [];
+            for (var i = 0; i < keys.length; i++) {
+                visible[keys[i]] = Boolean(arguments[i] && arguments[i] % 2);
+                if (visible[keys[i]] && loaded.indexOf(keys[i]) < 0) {
+                    loaded.push(keys[i]);
+                    added.push(keys[i]);
+                }
+            }
+            document.querySelectorAll(".js-plotly-plot").forEach(function (gd) {
+                var indices = [], values = [];
+                (gd.data || []).forEach(function (trace, index) {
+                    if (trace.meta in visible && (trace.visible !== false) !== visible[trace.meta]) {
+                        indices.push(index);
+                        values.push(visible[trace.meta]);
+                    }
+                });
+                if (indices.length) {
+                    Plotly.restyle(gd, {visible: values}, indices);
+                }
+            });
+            return {visible: visible, loaded: loaded, added: added};
+        },
+
+        // Insert the overlay traces sent for each ticker into its graph, keeping
+        // the chart first and the overlays in OVERLAY_KEYS order as the live
+        // updates expect. Graphs not drawn yet get them with their figure.
+        add_overlays: function (traces) {
+            Object.keys(traces || {}).forEach(function (ticker) {
+                var id = JSON.stringify({ticker: ticker, type: "stock-graph"});
+                var graph = document.getElementById(id);
+                var gd = graph && (graph.classList.contains("js-plotly-plot") ?
+                    graph : graph.querySelector(".js-plotly-plot"));
+                if (!gd || !gd.data || !gd.data.length) {
+                    return;
+                }
+                var present = gd.data.map(function (trace) { return trace.meta; });
+                traces[ticker].forEach(function (trace) {
+                    if (present.indexOf(trace.meta) >= 0) {
+                        return;
+                    }
+                    var rank = OVERLAY_KEYS.indexOf(trace.meta), position = 0;
+                    gd.data.forEach(function (other) {
+                        if (OVERLAY_KEYS.indexOf(other.meta) <= rank) {
+                            position++;
+                        }
+                    });
+                    Plotly.addTraces(gd, [trace], [position]);
+                });
+            });
+            return null;
+        }
+    }
+});
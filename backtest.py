@@ -0,0 +1,138 @@
+import concurrent.futures
+import datetime
+import functools
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from indicators import rolling_mean, rolling_std
+from rules import RuleEngine
+from universe import UNIVERSE_TIMEOUT, Panel, read_universe
+
+# processes a universe backtest is sharded over
+BACKTEST_WORKERS = int(os.environ.get("BACKTEST_WORKERS", os.cpu_count() or 1))
+# fraction of the price paid on every change of position
+COST = float(os.environ.get("BACKTEST_COST", 0.0))
+# where shared panels are written, RAM backed where the system has it
+SHARED_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+
+# The indicator series the rule builder's rules are written against, for a
+# close array of one ticker (dates) or a panel (dates x tickers)
+def rule_series(close, window_size=10, num_of_std=5):
+    mean = rolling_mean(close, window_size)
+    std = rolling_std(close, window_size)
+    return {
+        ("Bollinger band", "upper-band"): mean + std * num_of_std,
+        ("Bollinger band", "mean-band"): mean,
+        ("Bollinger band", "lower-band"): mean - std * num_of_std,
+        ("Moving average", "average"): rolling_mean(close, 5),
+    }
+
+
+# Long while the signal holds: a signal on a bar's close is traded on the next
+# bar, so the position is the signal shifted by one. Every step is a pass over
+# axis 0, so close and signal may be one ticker's dates or a dates x tickers
+# panel. Returns total P&L, maximum drawdown (both as fractions), trade count
+# and the fraction of bars spent in the market, per ticker.
+def backtest(close, signal, cost=COST):
+    close = np.asarray(close, dtype="float64")
+    position = np.zeros(close.shape)
+    position[1:] = signal[:-1]
+
+    returns = np.zeros(close.shape)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns[1:] = close[1:] / close[:-1] - 1
+    returns[~np.isfinite(returns)] = 0
+
+    changes = np.abs(np.diff(position, axis=0, prepend=0))
+    pnl = position * returns - changes * cost
+    equity = np.cumprod(1 + pnl, axis=0)
+    drawdown = 1 - equity / np.maximum.accumulate(equity, axis=0)
+    return {
+        "pnl": equity[-1] - 1 if len(equity) else np.zeros(close.shape[1:]),
+        "max_drawdown": drawdown.max(axis=0, initial=0),
+        "trades": (np.diff(position, axis=0, prepend=0) > 0).sum(axis=0),
+        "exposure": position.mean(axis=0) if len(position) else np.zeros(close.shape[1:]),
+    }
+
+
+# Every rule over the same closes, sharing the indicator series and the mask
+# cache, so sub-expressions common to several rules are only evaluated once
+def backtest_rules(close, rules, cost=COST):
+    engine = RuleEngine(np.arange(len(close)), rule_series(close))
+    return [backtest(close, engine.mask(rule), cost) for rule in rules]
+
+
+# A panel field written once to a RAM-backed .npy file; workers map the same
+# pages read-only instead of each receiving a pickled copy
+class SharedArray:
+    def __init__(self, array):
+        fd, self.path = tempfile.mkstemp(suffix=".npy", dir=SHARED_DIR)
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, array)
+
+    def close(self):
+        os.unlink(self.path)
+
+
+def _run_shard(path, lo, hi, rules, cost):
+    close = np.load(path, mmap_mode="r")
+    return backtest_rules(np.asarray(close[:, lo:hi]), rules, cost)
+
+
+@functools.lru_cache(maxsize=1)
+def _pool():
+    return concurrent.futures.ProcessPoolExecutor(max_workers=BACKTEST_WORKERS)
+
+
+# Backtest every rule on every ticker of the panel. The close panel goes into
+# shared memory once (see SharedArray) and each worker takes a contiguous
+# block of tickers. Returns one dict per rule of per-ticker arrays aligned on
+# panel.tickers.
+def backtest_panel(panel, rules, cost=COST, workers=BACKTEST_WORKERS):
+    close = panel["Close"]
+    if workers <= 1 or close.shape[1] < 2 * workers:
+        return backtest_rules(close, rules, cost)
+
+    shared = SharedArray(np.ascontiguousarray(close))
+    try:
+        bounds = np.linspace(0, close.shape[1], workers + 1).astype(int)
+        futures = [_pool().submit(_run_shard, shared.path, lo, hi, rules, cost)
+                   for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+        shards = [future.result() for future in futures]
+    finally:
+        shared.close()
+    return [{key: np.concatenate([shard[i][key] for shard in shards]) for key in shards[0][i]}
+            for i in range(len(rules))]
+
+
+# Results per rule over every ticker of the universe that loaded, with those
+# tickers and the ones left out (failed, timed out or without bars)
+def backtest_universe(rules, start, end, cost=COST, workers=BACKTEST_WORKERS):
+    panel = Panel.load(read_universe(), start, end, timeout=UNIVERSE_TIMEOUT)
+    return panel.tickers, backtest_panel(panel, rules, cost, workers), panel.missing
+
+
+if __name__ == "__main__":
+    from rules import all_of, any_of, compare
+
+    end = datetime.datetime.now()
+    panel = Panel.load(read_universe(), end - datetime.timedelta(days=3 * 365), end, timeout=UNIVERSE_TIMEOUT)
+    if panel.missing:
+        print("%d tickers left out: %s" % (len(panel.missing), " ".join(panel.missing)))
+    levels = np.nanpercentile(panel["Close"], [20, 40, 60, 80])
+    rules = [any_of(compare(("Moving average", "average"), "<=", low),
+                    all_of(compare(("Bollinger band", "lower-band"), ">=", low),
+                           compare(("Bollinger band", "upper-band"), "<=", high)))
+             for low in levels for high in levels if high > low]
+    count = len(rules) * len(panel.tickers)
+
+    for workers in (1, BACKTEST_WORKERS):
+        t = time.time()
+        results = backtest_panel(panel, rules, workers=workers)
+        elapsed = time.time() - t
+        print("%d workers: %d ticker x rule backtests over %d bars in %.2fs (%.0f per hour)"
+              % (workers, count, len(panel.dates), elapsed, count / elapsed * 3600))
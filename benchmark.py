@@ -0,0 +1,233 @@
+import argparse
+import datetime
+import functools
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import data_source
+from data_source import DataSource, synthetic_frame
+
+# python benchmark.py [--tickers N] [--bars N] [--repeat N] [--seed N] [--output FILE]
+#
+# Reproducible timings on seeded synthetic bars, printed (or written) as JSON
+# so results can be compared between releases. The app benchmarks run against
+# the same synthetic bars, a throwaway disk cache and a clock frozen at END,
+# never Yahoo.
+
+TRACES = ["moving_average_trace", "e_moving_average_trace", "bollinger_trace", "pp_trace",
+          "volume_weighted_average_price_trace", "stoc_trace", "candlestick_trace", "scatter_trace",
+          "emasma_trace", "OHLC_trace"]
+END = datetime.datetime(2020, 5, 8)
+# the exchange clock the app sees: END, after the close
+CLOCK = END.replace(hour=17)
+
+
+def synthetic_frames(tickers, bars, seed):
+    dates = pd.bdate_range(end=END, periods=bars)
+    return {"SYN%03d" % i: synthetic_frame("SYN%03d" % i, dates, seed) for i in range(tickers)}
+
+
+# Data source of the app benchmarks: synthetic_frame bars for any ticker on
+# the `bars` business days up to END, the frames synthetic_frames builds
+class SyntheticSource(DataSource):
+    name = "benchmark"
+
+    def __init__(self, bars, seed):
+        self.dates = pd.bdate_range(end=END, periods=bars)
+        self.seed = seed
+
+    def fetch(self, stock_name, start, end):
+        df = synthetic_frame(stock_name, self.dates, self.seed)
+        return df[(df["Date"] >= pd.Timestamp(start)) & (df["Date"] <= pd.Timestamp(end))].reset_index(drop=True)
+
+
+# Wall time of func over repeat runs in milliseconds. setup() runs untimed
+# before every run and returns func's arguments.
+def measure(func, repeat, setup=None):
+    times = []
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        began = time.perf_counter()
+        func(*args)
+        times.append((time.perf_counter() - began) * 1e3)
+    return {"repeat": repeat, "min_ms": min(times), "median_ms": statistics.median(times),
+            "mean_ms": statistics.mean(times), "max_ms": max(times)}
+
+
+# Every stock_trace builder over all frames, on fresh copies so nothing is
+# served from the indicator pipeline of a previous run
+def bench_traces(results, frames, repeat):
+    import stock_trace
+
+    for name in TRACES:
+        func = getattr(stock_trace, name)
+        results["stock_trace.%s" % name] = measure(
+            lambda dfs: [func(df) for df in dfs], repeat,
+            lambda: ([df.copy() for df in frames.values()],))
+
+
+# One figure per frame with the chart and every overlay, as graph_objs
+# figures and as the dict figures the app sends (fast_figure), both encoded
+# to JSON the way they reach the browser
+def bench_figures(results, frames, repeat):
+    import plotly.graph_objs as go
+    import plotly.io as pio
+
+    import stock_trace
+    from fast_figure import compact, dash_json, figure_dict
+
+    layout = {"margin": {"b": 0, "r": 10, "l": 60, "t": 0}, "legend": {"x": 0}}
+    builders = [stock_trace.candlestick_trace, stock_trace.moving_average_trace, stock_trace.bollinger_trace,
+                stock_trace.e_moving_average_trace, stock_trace.pp_trace,
+                stock_trace.volume_weighted_average_price_trace]
+
+    def as_list(result):
+        return list(result) if isinstance(result, (list, tuple)) else [result]
+
+    built = [[t for b in builders for t in as_list(b(df))] for df in frames.values()]
+    compacted = [[c for t in traces for c in as_list(compact(t))] for traces in built]
+    results["figure.graph_objs"] = measure(
+        lambda: [pio.to_json(go.Figure(data=traces, layout=layout)) for traces in built], repeat)
+    results["figure.compact"] = measure(lambda: [[compact(t) for t in traces] for traces in built], repeat)
+    results["figure.dict"] = measure(
+        lambda: [dash_json(figure_dict(traces, layout)) for traces in compacted], repeat)
+
+
+def dash_request(client, output, outputs, inputs, state=()):
+    response = client.post("/_dash-update-component", json={
+        "output": output, "outputs": outputs, "inputs": inputs, "state": list(state),
+        "changedPropIds": ["%s.%s" % (json.dumps(i["id"], sort_keys=True, separators=(",", ":"))
+                                      if isinstance(i["id"], dict) else i["id"], i["property"])
+                           for i in inputs[:1]],
+    })
+    if response.status_code != 200:
+        raise RuntimeError("%s returned %d" % (output, response.status_code))
+    return response.data
+
+
+# update_graph and the per-ticker update_figure it triggers, through the Flask
+# test client and Dash's callback dispatch. The first run fetches into the
+# empty disk cache and is reported on its own.
+def bench_app(results, tickers, repeat):
+    from app import DEFAULT_VIEW, OVERLAY_TRACES, VIEW_DAYS, app
+
+    client = app.server.test_client()
+    # every overlay on, as after toggling each one
+    keys = [key for key, _, _ in OVERLAY_TRACES]
+    overlays = {"visible": dict.fromkeys(keys, True), "loaded": keys, "added": []}
+    figure_output = next(key for key in app.callback_map if "stock-graph" in key and key.endswith(".figure"))
+
+    def update_graph():
+        return dash_request(client, "graphs.children", {"id": "graphs", "property": "children"},
+                            [{"id": "stock-ticker-input", "property": "value", "value": tickers}])
+
+    def update_figures(view, overlays=overlays):
+        total = 0
+        for ticker in tickers:
+            graph_id = {"type": "stock-graph", "ticker": ticker}
+            total += len(dash_request(
+                client, figure_output, {"id": graph_id, "property": "figure"},
+                [{"id": graph_id, "property": "id", "value": graph_id},
+                 {"id": "view-state", "property": "data", "value": view}],
+                [{"id": "chart-width", "property": "data", "value": 1200},
+                 {"id": "overlay-state", "property": "data", "value": overlays}]))
+        return total
+
+    results["update_graph.cold"] = measure(lambda: (update_graph(), update_figures(None)), 1)
+    results["update_graph"] = measure(update_graph, repeat)
+    for period in VIEW_DAYS:
+        view = dict(DEFAULT_VIEW, time=period)
+        results["update_figure.%s" % period] = measure(lambda: update_figures(view), repeat)
+        results["update_figure.%s" % period]["payload_bytes"] = update_figures(view)
+    # the default: no overlay turned on, so only the chart is sent
+    results["update_figure.year.no_overlays"] = measure(lambda: update_figures(DEFAULT_VIEW, None), repeat)
+    results["update_figure.year.no_overlays"]["payload_bytes"] = update_figures(DEFAULT_VIEW, None)
+
+
+# Rule builder callbacks on the builder's stock, with every bound set
+def bench_rule_builder(results, repeat):
+    import app  # noqa: F401, registers the Dash app the builder's callbacks attach to
+    import rule_builder
+
+    data = dict(rule_builder.value_state(), handle="benchmark")
+    bands = data["Bollinger band"]
+    data["Bollinger band"] = dict(bands, **{"upper-bound": bands["data-upper"], "lower-bound": bands["data-lower"]})
+    average = data["Moving average"]
+    data["Moving average"] = dict(average, **{"upper-bound": average["data-upper"]})
+
+    results["rule_builder.build_rule_builder"] = measure(rule_builder.build_rule_builder, repeat)
+    for operation, times in (("and", (2, 1)), ("or", (1, 2))):
+        results["rule_builder.show_indicator_condition.%s" % operation] = measure(
+            lambda: rule_builder.show_indicator_condition(1, 1, "Bollinger band", data, *times), repeat)
+    results["rule_builder.show_backtest"] = measure(
+        lambda: rule_builder.show_backtest(1, data, None, None), repeat)
+    results["rule_builder.show_current_rules"] = measure(
+        lambda: rule_builder.show_current_rules(1, "Bollinger band", data), repeat)
+
+
+def run(tickers=10, bars=1000, repeat=5, seed=0, only=None):
+    # the app reads these at import, so they are set before it is loaded
+    data_source.SOURCES[SyntheticSource.name] = functools.partial(SyntheticSource, bars, seed)
+    os.environ["STOCK_DATA_SOURCE"] = SyntheticSource.name
+    os.environ["WARMUP"] = "0"
+    cache_dir = os.environ["STOCK_CACHE_DIR"] = tempfile.mkdtemp(prefix="stock-benchmark-")
+    # views and the disk cache go by the exchange clock, frozen so every run
+    # sees the same bars whatever the date
+    import trading_calendar
+    trading_calendar.now = lambda: CLOCK
+
+    frames = synthetic_frames(tickers, bars, seed)
+    suites = {
+        "traces": lambda results: bench_traces(results, frames, repeat),
+        "figures": lambda results: bench_figures(results, frames, repeat),
+        "app": lambda results: bench_app(results, list(frames), repeat),
+        "rule_builder": lambda results: bench_rule_builder(results, repeat),
+    }
+    results = {}
+    for name, suite in suites.items():
+        if only and name not in only:
+            continue
+        # a failing benchmark is reported and keeps the suite's earlier timings
+        try:
+            suite(results)
+        except Exception as e:
+            results["%s.error" % name] = "%s: %s" % (type(e).__name__, e)
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+    import dash
+    import plotly
+    return {
+        "config": {"tickers": tickers, "bars": bars, "repeat": repeat, "seed": seed},
+        "environment": {"python": platform.python_version(), "machine": platform.machine(),
+                        "numpy": np.__version__, "pandas": pd.__version__, "dash": dash.__version__,
+                        "plotly": plotly.__version__},
+        "results": results,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time trace builders, figures and callbacks on synthetic data")
+    parser.add_argument("--tickers", type=int, default=10)
+    parser.add_argument("--bars", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", nargs="*", choices=["traces", "figures", "app", "rule_builder"])
+    parser.add_argument("--output", help="write the JSON here instead of stdout")
+    args = parser.parse_args()
+
+    report = run(args.tickers, args.bars, args.repeat, args.seed, args.only)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
@@ -0,0 +1,86 @@
+import collections
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from data_source import COLUMNS
+
+# bytes of compact bars a process keeps before evicting the least recently used
+MEMORY_BUDGET = int(float(os.environ.get("STOCK_MEMORY_BUDGET_MB", 256)) * 2 ** 20)
+PRICES = ["High", "Low", "Open", "Close", "Adj Close"]
+NANOS_PER_DAY = 86400 * 10 ** 9
+
+
+# One ticker's daily bars as contiguous arrays: dates as int32 days since
+# 1970-01-01, prices as one float32 row per column and volume in the smallest
+# unsigned integer type that holds it. About a third of the float64 frame,
+# and the frames callbacks need are rebuilt from any slice of it.
+class CompactFrame:
+    __slots__ = ("days", "prices", "volume")
+
+    def __init__(self, days, prices, volume):
+        self.days = days
+        self.prices = prices
+        self.volume = volume
+
+    @classmethod
+    def from_frame(cls, df):
+        days = pd.DatetimeIndex(df["Date"]).values.astype("datetime64[D]").astype("int32")
+        prices = np.ascontiguousarray(df[PRICES].values.T, dtype="float32")
+        volume = np.nan_to_num(df["Volume"].values.astype("float64"))
+        dtype = np.min_scalar_type(int(volume.max())) if len(volume) else np.uint32
+        return cls(days, prices, volume.astype(np.promote_types(dtype, np.uint32)))
+
+    def __len__(self):
+        return len(self.days)
+
+    @property
+    def nbytes(self):
+        return self.days.nbytes + self.prices.nbytes + self.volume.nbytes
+
+    # position of the first bar at or after a timestamp
+    def searchsorted(self, when):
+        return int(np.searchsorted(self.days, -(-pd.Timestamp(when).value // NANOS_PER_DAY)))
+
+    def to_frame(self, start=0):
+        frame = {"Date": pd.DatetimeIndex(self.days[start:].astype("datetime64[D]").astype("datetime64[ns]"))}
+        for column, values in zip(PRICES, self.prices):
+            frame[column] = values[start:].astype("float64")
+        frame["Volume"] = self.volume[start:].astype("float64")
+        return pd.DataFrame(frame, columns=COLUMNS)
+
+
+# CompactFrames by ticker under one byte budget for the whole process, least
+# recently used evicted first. The newest entry is always kept.
+class CompactStore:
+    def __init__(self, max_bytes=MEMORY_BUDGET):
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, ticker):
+        with self.lock:
+            entry = self.entries.get(ticker)
+            if entry is not None:
+                self.entries.move_to_end(ticker)
+            return entry
+
+    # value is (CompactFrame, extra) so callers can keep e.g. a load time
+    def put(self, ticker, frame, extra=None):
+        with self.lock:
+            old = self.entries.pop(ticker, None)
+            if old is not None:
+                self.bytes -= old[0].nbytes
+            self.entries[ticker] = (frame, extra)
+            self.bytes += frame.nbytes
+            while self.bytes > self.max_bytes and len(self.entries) > 1:
+                _, (evicted, _) = self.entries.popitem(last=False)
+                self.bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,3 @@
+# The modules live at the repository root rather than in a package. pytest
+# puts this file's directory on sys.path while loading it, so tests/ can
+# import them under plain `pytest` as well as `python -m pytest`.
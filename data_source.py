@@ -0,0 +1,278 @@
+import concurrent.futures
+import os
+import threading
+import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+from stock_cache import CACHE_DIR
+
+COLUMNS = ["Date", "High", "Low", "Open", "Close", "Volume", "Adj Close"]
+
+# how long a batch waits on any single ticker before returning without it
+BATCH_TIMEOUT = float(os.environ.get("STOCK_BATCH_TIMEOUT", 10))
+BATCH_WORKERS = int(os.environ.get("STOCK_BATCH_WORKERS", 16))
+# fetches per second allowed to a remote provider, and the burst above it
+UPSTREAM_RATE = float(os.environ.get("STOCK_UPSTREAM_RATE", 5))
+UPSTREAM_BURST = int(os.environ.get("STOCK_UPSTREAM_BURST", 10))
+# bucket state shared by every process using the same cache directory
+UPSTREAM_STATE = os.path.join(CACHE_DIR, "upstream.rate")
+
+
+def empty_frame():
+    return pd.DataFrame(columns=COLUMNS)
+
+
+# Anything that can return daily OHLCV bars for a ticker between two datetimes
+# as a frame with a Date column plus COLUMNS, sorted by date.
+class DataSource:
+    name = None
+    # whether fetches go to a provider that must be rate limited
+    remote = False
+
+    def fetch(self, stock_name, start, end):
+        raise NotImplementedError
+
+    def __call__(self, stock_name, start, end):
+        return self.fetch(stock_name, start, end)
+
+
+class YahooSource(DataSource):
+    name = "yahoo"
+    remote = True
+
+    def fetch(self, stock_name, start, end):
+        pd.core.common.is_list_like = pd.api.types.is_list_like
+        from pandas_datareader import data as dr
+        from pandas_datareader._utils import RemoteDataError
+        try:
+            return dr.DataReader(stock_name, 'yahoo', start=start, end=end).reset_index()
+        except RemoteDataError as e:
+            # ranges with no sessions in them (weekends, holidays) come back as
+            # "No data fetched". Anything else (HTTP errors, throttling) raises,
+            # so the disk cache never records those sessions as absent.
+            if "No data fetched" not in str(e):
+                raise
+            return empty_frame()
+
+
+# Seeded random walk OHLCV bars on the given dates, the same for the same
+# ticker, dates and seed on every machine
+def synthetic_frame(ticker, dates, seed=0):
+    rng = np.random.RandomState(zlib.crc32(ticker.encode()) ^ seed)
+    close = 50 * np.exp(np.cumsum(rng.normal(0.0003, 0.02, len(dates))))
+    open_ = close * (1 + rng.normal(0, 0.005, len(dates)))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.01, len(dates))))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.01, len(dates))))
+    volume = rng.randint(1e5, 1e7, len(dates)).astype("float64")
+    return pd.DataFrame({
+        "Date": dates, "High": high, "Low": low, "Open": open_,
+        "Close": close, "Volume": volume, "Adj Close": close,
+    })
+
+
+# Seeded random walk per ticker, generated from a fixed epoch so overlapping
+# requests always agree. latency simulates the upstream round trip.
+class FakeSource(DataSource):
+    name = "fake"
+    epoch = pd.Timestamp("2000-01-03")
+
+    def __init__(self, latency=0.0, fail=()):
+        self.latency = latency
+        self.fail = set(fail)
+
+    def fetch(self, stock_name, start, end):
+        if self.latency:
+            time.sleep(self.latency)
+        if stock_name in self.fail:
+            raise IOError("fake source refused %s" % stock_name)
+        df = synthetic_frame(stock_name, pd.bdate_range(self.epoch, end))
+        return df[df["Date"] >= pd.Timestamp(start)].reset_index(drop=True)
+
+
+# Token bucket: up to `burst` fetches at once, then `rate` per second.
+# Callers reserve a token and sleep outside the lock until it is theirs, so
+# waiters are served in arrival order. With a path the bucket lives in that
+# file, updated under flock, and every process using it (all gunicorn
+# workers) shares the one rate; without one, or without fcntl, it is per
+# process.
+class RateLimiter:
+    def __init__(self, rate=UPSTREAM_RATE, burst=UPSTREAM_BURST, path=None):
+        self.rate = rate
+        self.burst = burst
+        self.path = path if fcntl is not None else None
+        self.tokens = float(burst)
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def _take(self, tokens, updated, now):
+        tokens = min(self.burst, tokens + max(now - updated, 0) * self.rate) - 1
+        return tokens, -tokens / self.rate if tokens < 0 else 0
+
+    def acquire(self):
+        with self.lock:
+            now = time.time()
+            if self.path is None:
+                self.tokens, wait = self._take(self.tokens, self.updated, now)
+                self.updated = now
+            else:
+                wait = self._acquire_shared(now)
+        if wait:
+            time.sleep(wait)
+
+    def _acquire_shared(self, now):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                tokens, updated = map(float, os.pread(fd, 64, 0).split())
+            except ValueError:
+                tokens, updated = float(self.burst), now
+            tokens, wait = self._take(tokens, updated, now)
+            os.ftruncate(fd, 0)
+            os.pwrite(fd, ("%r %r" % (tokens, now)).encode(), 0)
+            return wait
+        finally:
+            os.close(fd)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+# Single-flight layer in front of a source: concurrent fetches of the same
+# (ticker, range) wait on the first one and share its frame, so a burst of
+# callers fetching directly costs one upstream fetch per ticker (fetches
+# through load_cached are already serialized by the disk cache's ticker
+# lock). Remote sources are also rate limited, across processes.
+class CoalescingSource(DataSource):
+    def __init__(self, source, limiter=None):
+        self.source = source
+        self.name = source.name
+        self.remote = source.remote
+        self.limiter = limiter if limiter is not None else (
+            RateLimiter(path=UPSTREAM_STATE) if source.remote else None)
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.fetches = self.coalesced = 0
+
+    def fetch(self, stock_name, start, end):
+        key = (stock_name, pd.Timestamp(start), pd.Timestamp(end))
+        with self.lock:
+            flight = self.inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.inflight[key] = _Flight()
+                self.fetches += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result.copy()
+
+        try:
+            if self.limiter:
+                self.limiter.acquire()
+            flight.result = self.source.fetch(stock_name, start, end)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.inflight[key]
+            flight.done.set()
+
+    def stats(self):
+        lookups = self.fetches + self.coalesced
+        return {
+            "fetches": self.fetches,
+            "coalesced": self.coalesced,
+            "inflight": len(self.inflight),
+            "hit_ratio": self.coalesced / lookups if lookups else 0.0,
+        }
+
+
+SOURCES = {"yahoo": YahooSource, "fake": FakeSource}
+
+
+def get_source(name=None):
+    return CoalescingSource(SOURCES[name or os.environ.get("STOCK_DATA_SOURCE", "yahoo")]())
+
+
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=BATCH_WORKERS)
+
+
+# Run load(ticker) for every ticker concurrently. Returns ({ticker: result},
+# {ticker: error}); tickers that fail or miss the timeout land in errors and
+# never hold back the rest. Each ticker's timeout starts when its load does,
+# not while it waits for a worker, and the batch as a whole gives up after
+# one timeout per round of workers it needs. A timed out load keeps running
+# in the background; one that never started is cancelled.
+def load_batch(load, tickers, timeout=BATCH_TIMEOUT):
+    started = {}
+
+    def run(ticker):
+        started[ticker] = time.monotonic()
+        return load(ticker)
+
+    futures = {_executor.submit(run, ticker): ticker for ticker in tickers}
+    give_up = time.monotonic() + timeout * max(1, -(-len(futures) // BATCH_WORKERS))
+    results, errors = {}, {}
+    pending = set(futures)
+    while pending:
+        now = time.monotonic()
+        deadlines = [started[futures[f]] + timeout for f in pending if futures[f] in started]
+        wait_for = max(0.0, min(deadlines + [give_up, now + timeout]) - now)
+        done, pending = concurrent.futures.wait(pending, wait_for, concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                errors[futures[future]] = e
+        now = time.monotonic()
+        for future in list(pending):
+            began = started.get(futures[future])
+            if now >= give_up or (began is not None and now >= began + timeout):
+                future.cancel()
+                pending.discard(future)
+                errors[futures[future]] = TimeoutError("no data after %ss" % timeout)
+    return results, errors
+
+
+if __name__ == '__main__':
+    # offline check that a batch costs roughly one round trip, not one per ticker
+    source = FakeSource(latency=0.2)
+    tickers = ["T%d" % i for i in range(10)]
+    end = pd.Timestamp.now()
+    start = end - pd.Timedelta(days=365)
+
+    began = time.time()
+    for ticker in tickers:
+        source(ticker, start, end)
+    print("serial:     %.2fs" % (time.time() - began))
+
+    began = time.time()
+    load_batch(lambda t: source(t, start, end), tickers)
+    print("concurrent: %.2fs" % (time.time() - began))
+
+    # a burst of sessions opening the same tickers costs one fetch per ticker
+    coalescing = CoalescingSource(source)
+    began = time.time()
+    load_batch(lambda t: coalescing(t.split(":")[0], start, end),
+               ["%s:%d" % (ticker, user) for ticker in tickers[:2] for user in range(8)])
+    print("16 users x 2 tickers: %.2fs, %s" % (time.time() - began, coalescing.stats()))
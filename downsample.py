@@ -0,0 +1,71 @@
+import os
+
+import numpy as np
+
+# plotted points per pixel of chart width, and the budget when no width is known
+POINTS_PER_PIXEL = float(os.environ.get("CHART_POINTS_PER_PIXEL", 1))
+DEFAULT_MAX_POINTS = int(os.environ.get("CHART_MAX_POINTS", 1000))
+
+OHLC_TYPES = ("candlestick", "ohlc")
+ARRAY_PROPS = ("x", "y", "hovertext", "text")
+
+
+def max_points_for_width(width):
+    return max(int(width * POINTS_PER_PIXEL), 3) if width else DEFAULT_MAX_POINTS
+
+
+# Largest-Triangle-Three-Buckets: positions of the n_out points of y (plotted
+# against position) that best keep the line's shape. NaNs are skipped.
+def lttb(y, n_out):
+    finite = np.flatnonzero(np.isfinite(y))
+    if len(finite) <= n_out:
+        return finite
+    if n_out < 3:
+        return finite[[0, -1]]
+    xs, ys = finite.astype("float64"), y[finite]
+    edges = np.linspace(1, len(finite) - 1, n_out - 1).astype(int)
+    selected = [0]
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_hi = edges[i + 2] if i + 2 < len(edges) else len(finite)
+        cx, cy = xs[hi:next_hi].mean(), ys[hi:next_hi].mean()
+        ax, ay = xs[selected[-1]], ys[selected[-1]]
+        area = np.abs((ax - cx) * (ys[lo:hi] - ay) - (ax - xs[lo:hi]) * (cy - ay))
+        selected.append(lo + int(np.argmax(area)))
+    selected.append(len(finite) - 1)
+    return finite[selected]
+
+
+# Merge consecutive bars into n_out buckets keeping each bucket's first open,
+# highest high, lowest low and last close, dated at the bucket's first bar.
+def ohlc_buckets(x, open_, high, low, close, n_out):
+    starts = np.unique(np.linspace(0, len(x), n_out + 1).astype(int)[:-1])
+    ends = np.append(starts[1:], len(x)) - 1
+    return (x[starts], open_[starts], np.maximum.reduceat(high, starts),
+            np.minimum.reduceat(low, starts), close[ends])
+
+
+def downsample_trace(trace, max_points):
+    x = trace.get("x")
+    if x is None or len(x) <= max_points:
+        return trace
+    x = np.asarray(x)
+    if trace.get("type") in OHLC_TYPES:
+        x, o, h, l, c = ohlc_buckets(x, *[np.asarray(trace[p], dtype="float64")
+                                          for p in ("open", "high", "low", "close")], max_points)
+        return dict(trace, x=x, open=o, high=h, low=l, close=c)
+    keep = lttb(np.asarray(trace["y"], dtype="float64"), max_points)
+    columns = {}
+    for prop in ARRAY_PROPS:
+        values = trace.get(prop)
+        if values is not None and not isinstance(values, str) and len(values) == len(x):
+            columns[prop] = np.asarray(values)[keep]
+    return dict(trace, **columns)
+
+
+# Reduce the output of a stock_trace builder (one trace dict or a list/tuple
+# of them) to at most max_points points per trace.
+def downsample(result, max_points):
+    if isinstance(result, (list, tuple)):
+        return type(result)(downsample_trace(t, max_points) for t in result)
+    return downsample_trace(result, max_points)
@@ -0,0 +1,106 @@
+import datetime
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# decimals kept for prices sent to the browser
+PRECISION = int(os.environ.get("CHART_PRECISION", 4))
+
+
+def compact_array(values):
+    values = np.asarray(values)
+    if values.dtype == object and len(values) and isinstance(values[0], (datetime.date, np.datetime64)):
+        values = pd.DatetimeIndex(values).values
+    if np.issubdtype(values.dtype, np.datetime64):
+        # plain dates for daily bars, seconds only when there is a time of day
+        unit = "D" if not (values.astype("datetime64[s]").astype("int64") % 86400).any() else "s"
+        return np.datetime_as_string(values, unit=unit).tolist()
+    if np.issubdtype(values.dtype, np.floating):
+        return np.round(values, PRECISION)
+    return values
+
+
+# Trace dict from a stock_trace builder with its arrays compacted: dates as
+# ISO strings, floats rounded to PRECISION. Converted once and cached, so
+# callbacks never copy or convert them again.
+def trace_dict(trace):
+    result = {}
+    for prop, value in trace.items():
+        if isinstance(value, (np.ndarray, list, tuple, pd.Series)):
+            value = compact_array(value)
+        result[prop] = value
+    return result
+
+
+def compact(result):
+    if isinstance(result, (list, tuple)):
+        return [trace_dict(t) for t in result]
+    return trace_dict(result)
+
+
+# dcc.Graph figure from trace dicts; the layout dict is shared, not copied
+def figure_dict(data, layout):
+    return {"data": data, "layout": layout}
+
+
+# A figure as Dash sends it: Dash encodes callback outputs itself with
+# json.dumps and plotly's encoder, so this only measures that step.
+def dash_json(figure):
+    from plotly.utils import PlotlyJSONEncoder
+    return json.dumps(figure, cls=PlotlyJSONEncoder).encode()
+
+
+if __name__ == '__main__':
+    # python fast_figure.py [figures] [days]: go.Figure vs dict figures, with
+    # every overlay on, measuring build time and JSON bytes per figure
+    import plotly.graph_objs as go
+    import plotly.io as pio
+
+    from data_source import FakeSource
+    from stock_trace import (bollinger_trace, candlestick_trace, e_moving_average_trace, moving_average_trace,
+                             pp_trace, volume_weighted_average_price_trace)
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 365
+    layout = {'margin': {'b': 0, 'r': 10, 'l': 60, 't': 0}, 'legend': {'x': 0}}
+    builders = [candlestick_trace, moving_average_trace, bollinger_trace, e_moving_average_trace,
+                pp_trace, volume_weighted_average_price_trace]
+    end = datetime.datetime(2020, 1, 1)
+    frames = [FakeSource()("T%d" % i, end - datetime.timedelta(days=days), end) for i in range(count)]
+
+    def as_list(result):
+        return list(result) if isinstance(result, (list, tuple)) else [result]
+
+    built = [[t for b in builders for t in as_list(b(df))] for df in frames]
+
+    began = time.time()
+    figures = []
+    for traces in built:
+        fig = go.Figure(data=[traces[0]], layout=layout)
+        for trace in traces[1:]:
+            fig.add_trace(trace)
+        figures.append(fig)
+    build_go = (time.time() - began) / count
+    began = time.time()
+    payload_go = [pio.to_json(fig).encode() for fig in figures]
+    json_go = (time.time() - began) / count
+
+    began = time.time()
+    compacted = [[trace_dict(t) for t in traces] for traces in built]
+    convert = (time.time() - began) / count
+    began = time.time()
+    figures = [figure_dict(list(traces), layout) for traces in compacted]
+    build_fast = (time.time() - began) / count
+    began = time.time()
+    payload_fast = [dash_json(fig) for fig in figures]
+    json_fast = (time.time() - began) / count
+
+    print("%d figures x %d bars, %d traces each" % (count, len(frames[0]), len(built[0])))
+    print("go.Figure: build %.2fms  json %.2fms  %d bytes"
+          % (build_go * 1e3, json_go * 1e3, sum(map(len, payload_go)) / count))
+    print("dict:      build %.2fms  json %.2fms  %d bytes, one-off conversion %.2fms"
+          % (build_fast * 1e3, json_fast * 1e3, sum(map(len, payload_fast)) / count, convert * 1e3))
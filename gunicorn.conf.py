@@ -0,0 +1,9 @@
+# gunicorn settings for the Procfile's web process
+
+
+# Each worker starts its warm-up and shared store loader once it has loaded
+# the app, instead of waiting for the first request routed to it. Threads
+# do not survive a fork, so this runs in the worker, not the master.
+def post_worker_init(worker):
+    import app
+    app.start_background()
@@ -0,0 +1,44 @@
+import json
+import subprocess
+import sys
+
+# python import_profile.py [module] [--json]: import the module in a fresh
+# interpreter with -X importtime and report where worker cold start goes.
+TOP = 25
+
+
+def profile(module="app"):
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import %s" % module],
+                          stderr=subprocess.PIPE, universal_newlines=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # nesting shows as two extra spaces of indent per level
+        rows.append({"module": name.strip(), "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+                     "self_us": int(self_us), "cumulative_us": int(cumulative_us)})
+    target = [r for r in rows if r["depth"] == 0 and r["module"] == module]
+    direct = [r for r in rows if r["depth"] == 1]
+    return {
+        "module": module,
+        "returncode": proc.returncode,
+        "total_us": target[-1]["cumulative_us"] if target else 0,
+        "direct": sorted(direct, key=lambda r: -r["cumulative_us"])[:TOP],
+        "slowest_self": sorted(rows, key=lambda r: -r["self_us"])[:TOP],
+    }
+
+
+if __name__ == '__main__':
+    args = [a for a in sys.argv[1:] if a != "--json"]
+    report = profile(args[0] if args else "app")
+    if "--json" in sys.argv:
+        print(json.dumps(report, indent=2))
+    else:
+        print("import %s: %.0fms (exit %d)" % (report["module"], report["total_us"] / 1e3, report["returncode"]))
+        print("\nslowest direct imports (cumulative)")
+        for r in report["direct"]:
+            print("  %8.1fms  %s" % (r["cumulative_us"] / 1e3, r["module"]))
+        print("\nslowest modules (self)")
+        for r in report["slowest_self"]:
+            print("  %8.1fms  %s" % (r["self_us"] / 1e3, r["module"]))
@@ -0,0 +1,110 @@
+import collections
+import os
+import sys
+import threading
+
+import numpy as np
+
+from downsample import downsample
+from fast_figure import compact
+
+# budget for memoized traces, in bytes of memory they hold
+MAX_BYTES = int(os.environ.get("INDICATOR_CACHE_BYTES", 64 * 1024 * 1024))
+
+
+# Least recently used cache bounded by the total size of its values, with
+# hit/miss counters so the callbacks can report how much work they reused.
+class LRUCache:
+    def __init__(self, max_bytes=MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size):
+        with self.lock:
+            if key in self.entries:
+                self.bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes and len(self.entries) > 1:
+                self.bytes -= self.entries.popitem(last=False)[1][1]
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+indicator_cache = LRUCache()
+
+
+def frame_key(df):
+    if not len(df):
+        return 0, None, None, None
+    # the last close changes while today's bar is still moving
+    return len(df), df["Date"].iloc[0], df["Date"].iloc[-1], df["Close"].iloc[-1]
+
+
+def value_size(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        # compacted dates are lists of str, each its own object
+        return sys.getsizeof(value) + sum(sys.getsizeof(v) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(value_size(v) for v in value.values())
+    return sys.getsizeof(value)
+
+
+# Bytes held by a cached result (one trace dict or a list/tuple of them),
+# measured rather than estimated so the cache budget holds
+def trace_size(result):
+    traces = result if isinstance(result, (list, tuple)) else [result]
+    return sum(value_size(trace) for trace in traces) or 1
+
+
+# Build trace(s) with func(df, **params) once per (ticker, date range,
+# indicator, parameters); later calls return the memoized traces. With
+# max_points the traces are downsampled to at most that many points each,
+# with compact_dict they are cached as plain dicts (see fast_figure.trace_dict).
+# Every max_points at or above len(df) leaves the traces whole and shares one
+# entry, so chart widths only split the cache for ranges they downsample.
+def cached_trace(ticker, df, func, max_points=None, compact_dict=False, **params):
+    if max_points and len(df) <= max_points:
+        max_points = None
+    key = (ticker, frame_key(df), func.__name__, tuple(sorted(params.items())), max_points, compact_dict)
+    result = indicator_cache.get(key)
+    if result is None:
+        result = func(df, **params)
+        if max_points:
+            result = downsample(result, max_points)
+        if compact_dict:
+            result = compact(result)
+        indicator_cache.put(key, result, trace_size(result))
+    return result
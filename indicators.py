@@ -0,0 +1,104 @@
+import warnings
+import weakref
+
+import numpy as np
+
+
+# Rolling window helpers over axis 0, so the same code serves one ticker's
+# column and a dates x tickers panel. NaNs count as missing observations and
+# a window with fewer than min_periods observations is NaN, like pandas.
+def rolling_sum(values, window, min_periods=None):
+    min_periods = window if min_periods is None else min_periods
+    valid = ~np.isnan(values)
+    zero = np.zeros((1,) + values.shape[1:])
+    total = np.cumsum(np.concatenate((zero, np.where(valid, values, 0.0))), axis=0)
+    count = np.cumsum(np.concatenate((zero, valid)), axis=0)
+    lag = np.maximum(np.arange(1, len(values) + 1) - window, 0)
+    result = total[1:] - total[lag]
+    result[count[1:] - count[lag] < min_periods] = np.nan
+    return result
+
+
+def rolling_mean(values, window):
+    return rolling_sum(values, window) / window
+
+
+def rolling_std(values, window):
+    return PrefixSums(values).std(window)
+
+
+# Prefix sums of a column or panel and of its squares, built once so the
+# rolling mean and std of any further window costs two subtractions. Each
+# series is centred first so the sum of squares doesn't lose precision.
+class PrefixSums:
+    def __init__(self, values):
+        valid = ~np.isnan(values)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            self.center = np.nanmean(values, axis=0)
+        centered = np.where(valid, values - self.center, 0.0)
+        zero = np.zeros((1,) + values.shape[1:])
+        self.total = np.cumsum(np.concatenate((zero, centered)), axis=0)
+        self.squares = np.cumsum(np.concatenate((zero, centered * centered)), axis=0)
+        self.count = np.cumsum(np.concatenate((zero, valid)), axis=0)
+
+    def _window(self, sums, window):
+        lag = np.maximum(np.arange(1, len(sums)) - window, 0)
+        result = sums[1:] - sums[lag]
+        result[self.count[1:] - self.count[lag] < window] = np.nan
+        return result
+
+    def mean(self, window):
+        return self._window(self.total, window) / window + self.center
+
+    def std(self, window):
+        if window < 2:
+            return np.full(self.total[1:].shape, np.nan)
+        total = self._window(self.total, window)
+        squares = self._window(self.squares, window)
+        return np.sqrt(np.maximum(squares - total * total / window, 0) / (window - 1))
+
+
+# How each intermediate is built from the frame. Keys are tuples so windowed
+# intermediates are shared by every indicator asking for the same window.
+COMPUTE = {
+    "column": lambda p, name: np.ascontiguousarray(p.df[name].values, dtype="float64"),
+    "typical": lambda p: (p.column("High") + p.column("Low") + p.column("Close")) / 3,
+    "sma": lambda p, window: rolling_mean(p.column("Close"), window),
+    "std": lambda p, window: rolling_std(p.column("Close"), window),
+    "vwap": lambda p, window: (rolling_sum(p.get("typical") * p.column("Volume"), window, 1)
+                               / rolling_sum(p.column("Volume"), window, 1)),
+}
+
+
+# Lazily computed, memoized NumPy intermediates for one frame.
+class Pipeline:
+    def __init__(self, df):
+        self._df = weakref.ref(df)
+        self.values = {}
+
+    @property
+    def df(self):
+        return self._df()
+
+    def get(self, kind, *args):
+        key = (kind,) + args
+        if key not in self.values:
+            self.values[key] = COMPUTE[kind](self, *args)
+        return self.values[key]
+
+    def column(self, name):
+        return self.get("column", name)
+
+
+_pipelines = {}
+
+
+# One Pipeline per live frame, so every overlay drawn from the same frame
+# shares its intermediates; the entry goes away with the frame.
+def pipeline(df):
+    entry = _pipelines.get(id(df))
+    if entry is None or entry.df is not df:
+        entry = _pipelines[id(df)] = Pipeline(df)
+        weakref.finalize(df, _pipelines.pop, id(df), None)
+    return entry
@@ -0,0 +1,95 @@
+import collections
+import os
+import threading
+
+from streaming import BollingerBands, MovingAverage, PivotPoints, TickerIndicators, VolumeWeightedAveragePrice
+from stock_data import frame_store
+from tick_feed import get_feed
+
+# points kept per trace on a live chart, older ones are dropped client side
+MAX_POINTS = int(os.environ.get("LIVE_MAX_POINTS", 500))
+# refresh period of the live interval, in milliseconds
+LIVE_INTERVAL = int(os.environ.get("LIVE_INTERVAL_MS", 2000))
+# daily bars replayed into the streaming indicators before the first tick
+SEED_BARS = 60
+
+# overlays in the order update_graph adds them, with the traces each one adds
+OVERLAYS = [("MA", 1), ("BB", 3), ("EMA", 1), ("PP", 7), ("VWAP", 1)]
+OHLC_CHARTS = ("candlestick_trace", "OHLC_trace")
+
+
+# Streaming counterparts of the batch overlays; the "EMA" overlay plots the
+# 20 bar mean (see e_moving_average_trace), so it does here too.
+def live_indicators():
+    return TickerIndicators({
+        "MA": MovingAverage(5),
+        "BB": BollingerBands(10, 5),
+        "EMA": MovingAverage(20),
+        "PP": PivotPoints(),
+        "VWAP": VolumeWeightedAveragePrice(5),
+    })
+
+
+# Server-wide buffer of live bars per ticker with their overlay values. The
+# feed is polled once per ticker whatever the number of sessions watching,
+# and each bar goes through the streaming indicators exactly once. self.lock
+# only guards the dict of books, each book has a lock of its own.
+class LiveBook:
+    def __init__(self, feed, load, max_points=MAX_POINTS):
+        self.feed = feed
+        self.load = load
+        self.max_points = max_points
+        self.books = {}
+        self.lock = threading.Lock()
+
+    # the history is loaded (maybe fetched) outside every lock; if two
+    # callers race, the first book stored wins
+    def _book(self, ticker):
+        with self.lock:
+            book = self.books.get(ticker)
+        if book is None:
+            history = self.load(ticker)
+            book = {
+                "indicators": live_indicators().replay(history.tail(SEED_BARS)),
+                "bars": collections.deque(maxlen=self.max_points),
+                "last": history.iloc[-1].to_dict() if len(history) else None,
+                "lock": threading.Lock(),
+            }
+            with self.lock:
+                book = self.books.setdefault(ticker, book)
+        return book
+
+    def bars_since(self, ticker, since=None):
+        book = self._book(ticker)
+        with book["lock"]:
+            for bar in self.feed.poll(ticker, book["last"]):
+                book["bars"].append((bar, book["indicators"].update(bar)))
+                book["last"] = bar
+            return [entry for entry in book["bars"] if since is None or entry[0]["Date"] > since]
+
+
+live_book = LiveBook(get_feed(), frame_store.get)
+
+
+# dcc.Graph extendData for the given (bar, overlay values) entries: the base
+# trace gets the bars, every overlay trace on the chart gets its values.
+def extend_data(entries, chart, overlays):
+    x = [bar["Date"].isoformat() for bar, _ in entries]
+    update = {"x": [x], "y": [[]]}
+    if chart in OHLC_CHARTS:
+        for column in ("open", "high", "low", "close"):
+            update[column] = [[bar[column.capitalize()] for bar, _ in entries]]
+    else:
+        update["y"] = [[bar["Close"] for bar, _ in entries]]
+
+    for name, traces in OVERLAYS:
+        if name not in overlays:
+            continue
+        for i in range(traces):
+            values = [v[name][i] if traces > 1 else v[name] for _, v in entries]
+            update["x"].append(x)
+            update["y"].append(values)
+            for column in update:
+                if column not in ("x", "y"):
+                    update[column].append([])
+    return [update, list(range(len(update["x"]))), MAX_POINTS]
@@ -0,0 +1,151 @@
+import bisect
+import collections
+import contextlib
+import functools
+import os
+import threading
+import time
+
+from flask import Response, g, has_request_context
+
+# histogram bucket upper bounds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BYTES_BUCKETS = (1e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+HELP = {
+    "callback_seconds": "Wall time of a Dash callback function",
+    "callback_stage_seconds": "Callback time by stage: fetch, compute, figure, and serialize "
+                              "(Dash dispatch and JSON encoding after the function returns)",
+    "callback_request_seconds": "Wall time of the whole callback request",
+    "callback_payload_bytes": "Bytes of the callback response",
+    "callback_tickers": "Tickers a callback handled",
+}
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+def _labels(labels, **extra):
+    items = sorted(dict(labels, **extra).items())
+    return "{%s}" % ",".join('%s="%s"' % (k, str(v).replace('"', '\\"')) for k, v in items) if items else ""
+
+
+# Histograms keyed by name and labels, plus cache stats read at scrape time,
+# rendered in the Prometheus text format. Every gunicorn worker keeps its own
+# in memory and a scrape reaches whichever worker takes it, so each series
+# carries a worker="<pid>" label: counters from different workers never
+# overwrite each other, and queries aggregate them away, e.g.
+# sum without (worker) (rate(callback_seconds_bucket[5m])). A restarted
+# worker starts fresh series under its new pid.
+class Registry:
+    def __init__(self):
+        self.histograms = collections.defaultdict(dict)
+        self.caches = {}
+        self.lock = threading.Lock()
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            histogram = self.histograms[name].get(key)
+            if histogram is None:
+                histogram = self.histograms[name][key] = Histogram(buckets)
+            histogram.observe(value)
+
+    # stats() returns a dict of numbers, like LRUCache.stats
+    def cache(self, name, stats):
+        self.caches[name] = stats
+
+    def render(self):
+        worker = {"worker": os.getpid()}
+        lines = []
+        with self.lock:
+            for name, series in sorted(self.histograms.items()):
+                lines.append("# HELP %s %s" % (name, HELP.get(name, name)))
+                lines.append("# TYPE %s histogram" % name)
+                for key, histogram in sorted(series.items()):
+                    labels = dict(key, **worker)
+                    total = 0
+                    for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                        total += count
+                        lines.append("%s_bucket%s %d" % (name, _labels(labels, le=bound), total))
+                    lines.append("%s_sum%s %r" % (name, _labels(labels), histogram.sum))
+                    lines.append("%s_count%s %d" % (name, _labels(labels), total))
+        stats = {name: read() for name, read in sorted(self.caches.items())}
+        for field in sorted({field for values in stats.values() for field in values}):
+            lines.append("# TYPE cache_%s gauge" % field)
+            for name, values in stats.items():
+                if field in values:
+                    lines.append("cache_%s%s %r" % (field, _labels(worker, cache=name), float(values[field])))
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+_current = threading.local()
+
+
+# Times a Dash callback (put it under @app.callback). Stages inside it are
+# timed with stage(); the Flask hooks of register() add the serialization
+# time and payload size once Dash has encoded the response.
+def instrument(func):
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        _current.callback, _current.stages = name, collections.Counter()
+        began = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - began
+            registry.observe("callback_seconds", elapsed, callback=name)
+            for stage_name, seconds in _current.stages.items():
+                registry.observe("callback_stage_seconds", seconds, callback=name, stage=stage_name)
+            _current.callback = None
+            if has_request_context():
+                g.metrics_callback, g.metrics_callback_seconds = name, elapsed
+    return wrapper
+
+
+@contextlib.contextmanager
+def stage(name):
+    began = time.perf_counter()
+    try:
+        yield
+    finally:
+        if getattr(_current, "callback", None):
+            _current.stages[name] += time.perf_counter() - began
+
+
+def tickers(count):
+    callback = getattr(_current, "callback", None)
+    if callback:
+        registry.observe("callback_tickers", count, COUNT_BUCKETS, callback=callback)
+
+
+def register(server, route="/metrics"):
+    @server.before_request
+    def start_timer():
+        g.metrics_began = time.perf_counter()
+
+    @server.after_request
+    def record_request(response):
+        callback = g.get("metrics_callback")
+        if callback:
+            total = time.perf_counter() - g.metrics_began
+            registry.observe("callback_request_seconds", total, callback=callback)
+            registry.observe("callback_stage_seconds", max(total - g.metrics_callback_seconds, 0.0),
+                             callback=callback, stage="serialize")
+            registry.observe("callback_payload_bytes", response.content_length or 0, BYTES_BUCKETS,
+                             callback=callback)
+        return response
+
+    server.add_url_rule(route, "metrics", lambda: Response(registry.render(), mimetype="text/plain; version=0.0.4"))
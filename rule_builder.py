@@ -1,3 +1,5 @@
+import functools
+
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
@@ -7,14 +9,22 @@ import dash_table
 import dash_daq as daq
 import pandas as pd
 
-pd.core.common.is_list_like = pd.api.types.is_list_like
-from pandas_datareader import data as dr
-import pandas as pd
+import backtest
+import metrics
+import screener
+import stock_data
+import warmup
+from rules import RuleEngine, all_of, any_of, compare
+from session_cache import SessionCache
 
 from app import app
 
-def load_stock(stock_name, start='1/2/2019', end='20/4/2020'):
-    return dr.DataReader(stock_name, 'yahoo', start=start, end=end).reset_index()
+# the screener's table loads in the background from the first request on
+if warmup.WARMUP_ENABLED:
+    app.server.before_request(screener.refresh)
+
+def load_stock(stock_name, start='01/02/2019', end='20/4/2020'):
+    return stock_data.load_stock(stock_name, start, end)
 
 def bollinger_trace(df, window_size=10, num_of_std=5):
     price = df["Close"]
@@ -25,12 +35,13 @@ def bollinger_trace(df, window_size=10, num_of_std=5):
     return upper_band, rolling_mean, lower_band
 
 
-df_builder = load_stock("AAPL")
+# nothing is fetched at import, the frame and its stats load on first use
+@functools.lru_cache(maxsize=None)
+def builder_frame():
+    return load_stock("AAPL")
 
 params = ["Bollinger band", "Moving average"]
 
-selected_indicator = params[1]
-
 states=[("metric-select-dropdown", "value"),
         ("value-setter-panel", "children"),
         ("value-setter-store", "data"),
@@ -96,16 +107,30 @@ def create_alert():
     )
 
 
+# Full indicator series, kept server side per session (see series_cache)
+def load_series():
+    df_builder = builder_frame()
+    upper, mean, lower = bollinger_trace(df_builder)
+    average = df_builder.set_index('Date')["Close"].rolling(window=5).mean()
+    return {
+        "Bollinger band": {
+            'upper-band': upper,
+            'mean-band': mean,
+            'lower-band': lower,
+        },
+        "Moving average": {
+            "average": average,
+        },
+    }
+
+
+# Summary statistics and rule bounds, the only part that goes to the browser
 def load_df():
     result = {}
-    upper, mean, lower = bollinger_trace(df_builder)
-    df2 = df_builder.set_index('Date')
-    df2 = df2.rolling(window=5).mean()
+    series = load_series()
+    upper, mean, lower = [series["Bollinger band"][band] for band in ('upper-band', 'mean-band', 'lower-band')]
     result["Bollinger band"] = {
         "count": len(upper),
-        'upper-band': upper,
-        'mean-band': mean,
-        'lower-band': lower,
         'data-mean': mean.describe()["mean"],
         'data-upper': upper.describe()["mean"],
         'data-lower': lower.describe()["mean"],
@@ -113,10 +138,10 @@ def load_df():
         "mean-bound": 0,
         "lower-bound": 0,
     }
-    stats = df2["Close"].describe()
+    average = series["Moving average"]["average"]
+    stats = average.describe()
     result["Moving average"] = {
-        "count": len(df2),
-        "average": df2["Close"],
+        "count": len(average),
         'data-upper': stats["mean"] + stats["std"],
         'data-lower': stats["mean"] - stats["std"],
         "upper-bound": 0,
@@ -125,7 +150,56 @@ def load_df():
     return result
 
 
-value_state = load_df()
+@functools.lru_cache(maxsize=None)
+def value_state():
+    return load_df()
+
+
+series_cache = SessionCache()
+
+
+# The store only carries a handle to the session's series
+def session_series(store_data):
+    return series_cache.get(store_data["handle"], load_series)
+
+
+# What each bound means: (series, comparison, bound key). A bound left at 0
+# is not part of the rule.
+BOUND_RULES = {
+    "Bollinger band": [("upper-band", "<=", "upper-bound"),
+                       ("mean-band", ">=", "mean-bound"),
+                       ("lower-band", ">=", "lower-bound")],
+    "Moving average": [("average", "<=", "upper-bound"),
+                       ("average", ">=", "lower-bound")],
+}
+
+
+# AND or OR, whichever of the two buttons was clicked last (AND by default)
+def combine_with(and_time, or_time):
+    return "OR" if (or_time or 0) > (and_time or 0) else "AND"
+
+
+# Each indicator's bounds must all hold; indicators combine with AND or OR
+def build_rule(store_data, operation):
+    groups = []
+    for indicator, checks in BOUND_RULES.items():
+        conditions = [compare((indicator, band), op, store_data[indicator][bound])
+                      for band, op, bound in checks if store_data[indicator][bound]]
+        if conditions:
+            groups.append(all_of(*conditions))
+    if not groups:
+        return None
+    return any_of(*groups) if operation == "OR" else all_of(*groups)
+
+
+def session_rules(store_data):
+    def load():
+        series = session_series(store_data)
+        return RuleEngine(builder_frame()["Date"].values, {
+            (indicator, band): values.values
+            for indicator, bands in series.items() for band, values in bands.items()
+        })
+    return series_cache.get(store_data["handle"] + ":rules", load)
 
 
 def build_dropdown():
@@ -151,6 +225,49 @@ def build_buttons():
             ), ]
 
 
+@app.callback(
+    output=Output("backtest-output", "children"),
+    inputs=[Input("backtest-btn", "n_clicks")],
+    state=[
+        State(*states[2]),
+        State("and-btn", "n_clicks_timestamp"),
+        State("or-btn", "n_clicks_timestamp"),
+    ],
+)
+@metrics.instrument
+def show_backtest(n_clicks, data, and_time, or_time):
+    if not n_clicks or not data or "handle" not in data:
+        return html.Div()
+    operation = combine_with(and_time, or_time)
+    rule = build_rule(data, operation)
+    if rule is None:
+        return html.P("No rule set yet, update a limit to build one")
+
+    # long while the rule holds, on the builder's own stock
+    with metrics.stage("compute"):
+        signal = session_rules(data).mask(rule)
+        result = backtest.backtest(builder_frame()["Close"].values, signal)
+    return html.P("%s rule: P&L %.2f%%, max drawdown %.2f%%, %d trades, in the market %.0f%% of days" % (
+        operation, result["pnl"] * 100, result["max_drawdown"] * 100, result["trades"], result["exposure"] * 100))
+
+
+def build_screener():
+    return [html.Label(id="screener-title", children="Screen the S&P 500 with the current rule"),
+            dcc.Dropdown(
+                id="screener-sector",
+                options=[{"label": sector, "value": sector} for sector in screener.sectors()],
+                placeholder="All sectors",
+            ),
+            dcc.Dropdown(
+                id="screener-rank",
+                options=[{"label": "Nearest lower Bollinger band", "value": "percent-b"},
+                         {"label": "Furthest below moving average", "value": "ma-gap"}],
+                value="percent-b",
+                clearable=False,
+            ),
+            html.Button("Screen S&P 500", id="screener-btn")]
+
+
 def build_tab_1():
     return [
         html.Div(
@@ -178,7 +295,18 @@ def build_tab_1():
                         html.Div(
                             id="indicator-operation-output", className="operation-datatable"
                         ),
-
+                        html.Button("Backtest rule", id="backtest-btn"),
+                        html.Div(
+                            id="backtest-output", className="operation-datatable"
+                        ),
+                        html.Br(),
+                        html.Div(
+                            id="screener-div",
+                            children=build_screener(),
+                        ),
+                        html.Div(
+                            id="screener-output", className="output-datatable"
+                        ),
                     ],
                 ),
             ],
@@ -211,21 +339,25 @@ def build_value_setter_line(line_num, label, value, col3):
 def generate_section_banner(title):
     return html.Div(className="section-banner", children=title)
 
-rule_builder=html.Div(
-    id="big-app-container",
-    children=[
-        build_top(),
-        html.Div(
-            id="app-container",
-            children=[
-                build_tabs(),
-                html.Div(id="app-content"),
-            ],
-        ),
-        dcc.Store(id="value-setter-store", data=value_state)
-    ],
+def build_rule_builder():
+    handle = SessionCache.new_handle()
+    series_cache.put(handle, load_series())
+    return html.Div(
+        id="big-app-container",
+        children=[
+            build_top(),
+            html.Div(
+                id="app-container",
+                children=[
+                    build_tabs(),
+                    html.Div(id="app-content"),
+                ],
+            ),
+            dcc.Store(id="value-setter-store", data=dict(value_state(), handle=handle))
+        ],
+    )
+
 
-)
 @app.callback(
     Output("app-content", "children"),
     [Input("app-tabs", "value")],
@@ -238,9 +370,7 @@ def render_tab(tab_switch):
     inputs=[Input(*states[0])],
 )
 def build_panel(selected):
-    global selected_indicator
     if selected == params[0]:
-        selected_indicator = params[0]
         return (
             [
                 build_value_setter_line(
@@ -252,25 +382,24 @@ def build_panel(selected):
                 build_value_setter_line(
                     "value-setter-panel-ul",
                     "Upper band limit",
-                    value_state[selected]["data-upper"],
+                    value_state()[selected]["data-upper"],
                     ud_ul_input,
                 ),
                 build_value_setter_line(
                     "value-setter-panel-ml",
                     "mean band limit",
-                    value_state[selected]["data-mean"],
+                    value_state()[selected]["data-mean"],
                     ud_ml_input,
                 ),
                 build_value_setter_line(
                     "value-setter-panel-ll",
                     "lower band limit",
-                    value_state[selected]["data-lower"],
+                    value_state()[selected]["data-lower"],
                     ud_ll_input,
                 ),
             ]
         )
     if selected == params[1]:
-        selected_indicator = params[1]
         return (
             [
                 build_value_setter_line(
@@ -282,13 +411,13 @@ def build_panel(selected):
                 build_value_setter_line(
                     "value-setter-panel-ul",
                     "Upper limit",
-                    value_state[selected]["data-upper"],
+                    value_state()[selected]["data-upper"],
                     ud_ul_input,
                 ),
                 build_value_setter_line(
                     "value-setter-panel-ll",
                     "Lower limit",
-                    value_state[selected]["data-lower"],
+                    value_state()[selected]["data-lower"],
                     ud_ll_input,
                 ),
 
@@ -329,9 +458,68 @@ def store(*arg):
         Input(*states[0]),
         Input(*states[2]),
     ],
+    state=[
+        State("and-btn", "n_clicks_timestamp"),
+        State("or-btn", "n_clicks_timestamp"),
+    ],
 )
-def show_indicator_condition(and_click, or_click, selected, data):
-    pass
+@metrics.instrument
+def show_indicator_condition(and_click, or_click, selected, data, and_time, or_time):
+    if not data or "handle" not in data:
+        return html.Div()
+    # the operation button pressed last decides how indicators combine
+    operation = combine_with(and_time, or_time)
+    rule = build_rule(data, operation)
+    if rule is None:
+        return html.P("No rule set yet, update a limit to build one")
+
+    with metrics.stage("compute"):
+        result = session_rules(data).evaluate(rule)
+    latest = pd.DatetimeIndex(result["labels"][-5:]).strftime("%d/%m/%Y")
+    return html.Div([
+        html.P("%s rule: %d of %d days match" % (operation, result["count"], result["total"])),
+        html.P("Latest matches: " + (", ".join(latest) if len(latest) else "none")),
+    ])
+
+
+@app.callback(
+    output=Output("screener-output", "children"),
+    inputs=[Input("screener-btn", "n_clicks")],
+    state=[
+        State("screener-sector", "value"),
+        State("screener-rank", "value"),
+        State(*states[2]),
+        State("and-btn", "n_clicks_timestamp"),
+        State("or-btn", "n_clicks_timestamp"),
+    ],
+)
+@metrics.instrument
+def show_screen(n_clicks, sector, rank_by, data, and_time, or_time):
+    if not n_clicks or not data or "handle" not in data:
+        return html.Div()
+    operation = combine_with(and_time, or_time)
+    with metrics.stage("fetch"):
+        table = screener.latest_table()
+    if table is None:
+        return html.Div(html.P("The S&P 500 is still loading, screen again in a minute"))
+    with metrics.stage("compute"):
+        top, count = table.screen(build_rule(data, operation), sector, rank_by)
+    metrics.tickers(count)
+    summary = "%d stocks match, top %d shown" % (count, len(top))
+    if table.missing:
+        summary += " (%d tickers without data are left out)" % len(table.missing)
+    return html.Div([
+        html.P(summary),
+        dash_table.DataTable(
+            id="screener-table",
+            columns=[{"name": column, "id": column} for column in top.columns],
+            data=top.to_dict("records"),
+            style_table={"margin": "2rem"},
+            style_cell=default_cell(),
+            css=default_css(),
+            style_as_list_view=True,
+        ),
+    ])
 
 
 def default_css():
@@ -0,0 +1,80 @@
+import collections
+
+import numpy as np
+
+OPS = {">=": np.greater_equal, "<=": np.less_equal, ">": np.greater, "<": np.less}
+# sub-expression masks kept per engine
+MAX_CACHED = 256
+
+
+# Rules are nested tuples, so the same sub-expression always has the same
+# key in the mask cache:
+#   ("cmp", series, op, value)   one indicator series against a number
+#   ("and", rule, rule, ...)     every rule holds
+#   ("or", rule, rule, ...)      any rule holds
+def compare(series, op, value):
+    return ("cmp", series, op, float(value))
+
+
+def _combine(kind, rules):
+    flat = []
+    for rule in rules:
+        flat.extend(rule[1:] if rule[0] == kind else [rule])
+    return flat[0] if len(flat) == 1 else (kind,) + tuple(flat)
+
+
+def all_of(*rules):
+    return _combine("and", rules)
+
+
+def any_of(*rules):
+    return _combine("or", rules)
+
+
+# Evaluates rules as boolean masks over indicator arrays aligned on labels
+# (the dates of one ticker, the tickers of a screen, or the rows of a dates x
+# tickers panel). AND/OR stop as soon as the result can no longer change, and
+# every sub-expression mask is cached, so editing one bound only recomputes
+# the comparisons that changed. NaN (warm-up) values never match.
+class RuleEngine:
+    def __init__(self, labels, series, max_cached=MAX_CACHED):
+        self.labels = np.asarray(labels)
+        self.series = {name: np.asarray(values, dtype="float64") for name, values in series.items()}
+        self.max_cached = max_cached
+        self.cache = collections.OrderedDict()
+
+    def mask(self, rule):
+        cached = self.cache.get(rule)
+        if cached is not None:
+            self.cache.move_to_end(rule)
+            return cached
+
+        kind = rule[0]
+        if kind == "cmp":
+            _, name, op, value = rule
+            result = OPS[op](self.series[name], value)
+        elif kind == "and":
+            result = self.mask(rule[1])
+            for child in rule[2:]:
+                if not result.any():
+                    break
+                result = result & self.mask(child)
+        elif kind == "or":
+            result = self.mask(rule[1])
+            for child in rule[2:]:
+                if result.all():
+                    break
+                result = result | self.mask(child)
+        else:
+            raise ValueError("unknown rule %r" % (kind,))
+
+        # masks are shared through the cache, so nobody may write to them
+        result.flags.writeable = False
+        self.cache[rule] = result
+        if len(self.cache) > self.max_cached:
+            self.cache.popitem(last=False)
+        return result
+
+    def evaluate(self, rule):
+        mask = self.mask(rule)
+        return {"count": int(mask.sum()), "total": len(mask), "labels": self.labels[mask]}
@@ -0,0 +1,127 @@
+import datetime
+import functools
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import trading_calendar
+from rules import RuleEngine
+from stock_cache import REFRESH_SECONDS
+from universe import SNP500, UNIVERSE_TIMEOUT, Panel
+
+# calendar days of history loaded per ticker, enough to warm up every window
+SCREEN_DAYS = int(os.environ.get("SCREEN_DAYS", 60))
+TOP_K = 20
+# seconds a background build waits for each ticker
+BUILD_TIMEOUT = float(os.environ.get("SCREEN_BUILD_TIMEOUT", UNIVERSE_TIMEOUT))
+# a table some tickers failed to load for is rebuilt this much sooner than a
+# full one; tickers upstream has no bars for (delisted) don't count
+PARTIAL_SECONDS = 60
+
+# Scores a screen ranks its matches by, lowest first
+RANKINGS = {
+    # position inside the Bollinger band, nearest the lower band first
+    "percent-b": lambda v: (v["Close"] - v["lower-band"]) / (v["upper-band"] - v["lower-band"]),
+    # distance below the 5 bar average, furthest below first
+    "ma-gap": lambda v: (v["Close"] - v["average"]) / v["average"],
+}
+
+
+# Latest indicator values of every ticker in the universe, one array per
+# value aligned on tickers, with a RuleEngine over them using the same series
+# names as the rule builder so its rules run unchanged across the universe.
+class LatestTable:
+    def __init__(self, panel, sectors):
+        self.tickers = np.array(panel.tickers)
+        self.missing = list(panel.missing)
+        self.failed = list(panel.failed)
+        self.sectors = np.array([sectors.get(t, "") for t in panel.tickers])
+        upper, mean, lower = panel.bollinger()
+        self.values = {
+            "Close": panel.latest(panel["Close"]),
+            "upper-band": panel.latest(upper),
+            "mean-band": panel.latest(mean),
+            "lower-band": panel.latest(lower),
+            "average": panel.latest(panel.rolling_mean(5)),
+        }
+        self.engine = RuleEngine(self.tickers, {
+            ("Bollinger band", "upper-band"): self.values["upper-band"],
+            ("Bollinger band", "mean-band"): self.values["mean-band"],
+            ("Bollinger band", "lower-band"): self.values["lower-band"],
+            ("Moving average", "average"): self.values["average"],
+        })
+        self.built_at = time.time()
+
+    @classmethod
+    def build(cls, path=SNP500, days=SCREEN_DAYS, timeout=BUILD_TIMEOUT):
+        stocks = pd.read_csv(path)
+        end = trading_calendar.now()
+        panel = Panel.load(list(stocks["Symbol"]), end - datetime.timedelta(days=days), end, timeout=timeout)
+        return cls(panel, dict(zip(stocks["Symbol"], stocks["Sector"])))
+
+    def stale(self):
+        age = time.time() - self.built_at
+        return age > (PARTIAL_SECONDS if self.failed else REFRESH_SECONDS)
+
+    # Tickers matching rule (None matches all), optionally in one sector, as
+    # the k best by rank_by. Only the k winners are sorted (argpartition).
+    def screen(self, rule, sector=None, rank_by="percent-b", k=TOP_K):
+        mask = self.engine.mask(rule) if rule is not None else np.ones(len(self.tickers), dtype=bool)
+        if sector:
+            mask = mask & (self.sectors == sector)
+        candidates = np.flatnonzero(mask)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            score = RANKINGS[rank_by](self.values)[candidates]
+        score = np.where(np.isnan(score), np.inf, score)
+        best = np.argpartition(score, k)[:k] if len(candidates) > k else np.arange(len(candidates))
+        best = best[np.argsort(score[best], kind="stable")]
+        rows = candidates[best]
+        return pd.DataFrame({
+            "Symbol": self.tickers[rows],
+            "Sector": self.sectors[rows],
+            "Close": self.values["Close"][rows].round(2),
+            "Score": np.where(np.isinf(score[best]), np.nan, score[best]).round(4),
+        }), len(candidates)
+
+
+@functools.lru_cache(maxsize=1)
+def sectors(path=SNP500):
+    return sorted(pd.read_csv(path)["Sector"].dropna().unique())
+
+
+_table = None
+_building = None
+_table_lock = threading.Lock()
+
+
+def _build():
+    global _table, _building
+    try:
+        table = LatestTable.build()
+        with _table_lock:
+            _table = table
+    finally:
+        with _table_lock:
+            _building = None
+
+
+# Starts a background build when there is no table yet or it is stale, and
+# never waits for it: the universe takes far longer to load than a callback
+# should block.
+def refresh():
+    global _building
+    with _table_lock:
+        if _building is None and (_table is None or _table.stale()):
+            _building = threading.Thread(target=_build, name="screener-table", daemon=True)
+            _building.start()
+
+
+# Table shared by every screen in the process, None until the first build
+# has finished. A stale table is served while its replacement builds.
+def latest_table():
+    refresh()
+    with _table_lock:
+        return _table
@@ -0,0 +1,57 @@
+import os
+import threading
+import time
+import uuid
+
+# seconds a session's server-side data survives without being used
+SESSION_TTL = int(os.environ.get("SESSION_CACHE_TTL", 30 * 60))
+MAX_SESSIONS = int(os.environ.get("SESSION_CACHE_MAX", 1000))
+
+
+# Server-side values keyed by an opaque handle that the browser keeps in a
+# dcc.Store instead of the data itself. Entries expire `ttl` seconds after
+# their last use; a lookup after expiry (or on another worker) rebuilds the
+# value with the loader it is given.
+class SessionCache:
+    def __init__(self, ttl=SESSION_TTL, max_sessions=MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.last_sweep = time.time()
+
+    @staticmethod
+    def new_handle():
+        return uuid.uuid4().hex
+
+    def get(self, handle, load=None):
+        now = time.time()
+        with self.lock:
+            self._sweep(now)
+            entry = self.entries.get(handle)
+            if entry is not None:
+                self.entries[handle] = (entry[0], now)
+                return entry[0]
+        if load is None:
+            return None
+        value = load()
+        self.put(handle, value)
+        return value
+
+    def put(self, handle, value):
+        with self.lock:
+            self.entries[handle] = (value, time.time())
+            if len(self.entries) > self.max_sessions:
+                oldest = min(self.entries, key=lambda h: self.entries[h][1])
+                del self.entries[oldest]
+
+    def drop(self, handle):
+        with self.lock:
+            self.entries.pop(handle, None)
+
+    def _sweep(self, now):
+        if now - self.last_sweep < self.ttl / 10:
+            return
+        self.last_sweep = now
+        for handle in [h for h, (_, used) in self.entries.items() if now - used > self.ttl]:
+            del self.entries[handle]
@@ -0,0 +1,172 @@
+import itertools
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from compact_store import PRICES, CompactFrame
+from data_source import load_batch
+from stock_cache import CACHE_DIR, REFRESH_SECONDS
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# with SHARED_STORE=1 one worker process loads every ticker into memory-mapped
+# column files and all workers read them in place
+SHARED_STORE = os.environ.get("SHARED_STORE", "0") == "1"
+SHARED_DIR = os.environ.get("SHARED_STORE_DIR", os.path.join(CACHE_DIR, "shared"))
+# seconds between checks for a newer generation
+CHECK_SECONDS = 5
+# generations left on disk for readers still mapping them
+KEEP_GENERATIONS = 3
+COLUMNS = ("days", "prices", "volume")
+_published = itertools.count()
+
+
+# Write one generation: every ticker's CompactFrame concatenated into one .npy
+# per column plus an index of (offset, length) per ticker, in a directory of
+# its own. The "current" pointer then moves to it with an atomic rename, so a
+# reader sees either the old generation or the new one, never a mix.
+def publish(frames, root=SHARED_DIR):
+    os.makedirs(root, exist_ok=True)
+    generation = "gen-%013d-%d-%d" % (time.time() * 1000, os.getpid(), next(_published))
+    building = os.path.join(root, generation + ".tmp")
+    os.makedirs(building)
+
+    tickers = sorted(frames)
+    lengths = [len(frames[t]) for t in tickers]
+    offsets = np.concatenate(([0], np.cumsum(lengths))).astype(int)
+    parts = [frames[t] for t in tickers]
+    columns = {
+        "days": np.concatenate([f.days for f in parts] or [np.empty(0, "int32")]),
+        "prices": np.concatenate([f.prices for f in parts] or [np.empty((len(PRICES), 0), "float32")], axis=1),
+        "volume": np.concatenate([f.volume for f in parts] or [np.empty(0, "uint32")]),
+    }
+    for name, values in columns.items():
+        np.save(os.path.join(building, name + ".npy"), values)
+    with open(os.path.join(building, "index.json"), "w") as f:
+        json.dump({"created": time.time(),
+                   "tickers": {t: [int(offsets[i]), int(offsets[i + 1])] for i, t in enumerate(tickers)}}, f)
+    os.rename(building, os.path.join(root, generation))
+
+    pointer = os.path.join(root, "current")
+    with open(pointer + ".tmp", "w") as f:
+        f.write(generation)
+    os.replace(pointer + ".tmp", pointer)
+    _collect(root)
+    return generation
+
+
+def _collect(root, keep=KEEP_GENERATIONS):
+    generations = sorted(name for name in os.listdir(root) if name.startswith("gen-") and not name.endswith(".tmp"))
+    for name in generations[:-keep]:
+        # mapped files stay readable to anyone still holding them
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+# Read side, one per process. get() returns CompactFrames whose arrays are
+# read-only views into the mapped files: nothing is copied, and every worker
+# shares the same pages. A newer generation is picked up within
+# CHECK_SECONDS; one older than max_age is ignored (its loader has died).
+class SharedStore:
+    def __init__(self, root=SHARED_DIR, max_age=2 * REFRESH_SECONDS):
+        self.root = root
+        self.max_age = max_age
+        self.generation = None
+        self.created = 0.0
+        self.index = {}
+        self.columns = None
+        self.checked = 0.0
+        self.lock = threading.Lock()
+
+    def refresh(self, force=False):
+        now = time.time()
+        if not force and now - self.checked < CHECK_SECONDS:
+            return
+        self.checked = now
+        try:
+            with open(os.path.join(self.root, "current")) as f:
+                generation = f.read().strip()
+            if generation == self.generation:
+                return
+            path = os.path.join(self.root, generation)
+            with open(os.path.join(path, "index.json")) as f:
+                index = json.load(f)
+            columns = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r") for name in COLUMNS}
+        except (IOError, OSError, ValueError):
+            return
+        with self.lock:
+            self.generation, self.created = generation, index["created"]
+            self.index, self.columns = index["tickers"], columns
+
+    def get(self, ticker):
+        self.refresh()
+        with self.lock:
+            entry = self.index.get(ticker)
+            columns = self.columns
+            fresh = time.time() - self.created < self.max_age
+        if entry is None or not fresh:
+            return None
+        lo, hi = entry
+        return CompactFrame(columns["days"][lo:hi], columns["prices"][:, lo:hi], columns["volume"][lo:hi])
+
+    def stats(self):
+        self.refresh()
+        with self.lock:
+            return {
+                "entries": len(self.index),
+                "bytes": sum(c.nbytes for c in self.columns.values()) if self.columns else 0,
+                "age_seconds": time.time() - self.created if self.generation else 0.0,
+            }
+
+
+# Fills the store. Every worker runs one, but only the process holding the
+# loader lock loads and publishes; if it exits, another takes over within an
+# interval. Without fcntl every process loads.
+class Loader:
+    def __init__(self, load, tickers, root=SHARED_DIR, interval=REFRESH_SECONDS):
+        self.load = load
+        self.tickers = tickers
+        self.root = root
+        self.interval = interval
+        self.thread = None
+        self.lock = threading.Lock()
+        self.last_error = None
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="shared-store-loader", daemon=True)
+                self.thread.start()
+
+    def _acquire(self):
+        os.makedirs(self.root, exist_ok=True)
+        handle = open(os.path.join(self.root, "loader.lock"), "a")
+        if fcntl is None:
+            return handle
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return handle
+        except (IOError, OSError):
+            handle.close()
+            return None
+
+    def _run(self):
+        handle = None
+        while True:
+            handle = handle or self._acquire()
+            if handle is not None:
+                try:
+                    self.load_once()
+                except Exception as e:
+                    self.last_error = repr(e)
+            time.sleep(self.interval)
+
+    def load_once(self):
+        frames, errors = load_batch(self.load, self.tickers(), timeout=self.interval)
+        return publish({t: CompactFrame.from_frame(df) for t, df in frames.items() if len(df)}, self.root)
@@ -0,0 +1,199 @@
+import contextlib
+import datetime
+import json
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+import trading_calendar
+
+CACHE_DIR = os.environ.get(
+    "STOCK_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".stock_cache")
+)
+# how long today's (still moving) bar is trusted before the tail is refetched
+REFRESH_SECONDS = int(os.environ.get("STOCK_CACHE_REFRESH", 15 * 60))
+
+COLUMNS = ["High", "Low", "Open", "Close", "Volume", "Adj Close"]
+ONE_DAY = datetime.timedelta(days=1)
+
+
+# One directory per ticker, one .npy file per column plus a meta.json holding
+# the date range that has already been requested from upstream, the sessions
+# in it that upstream had no bar for and those fetched before their close.
+# Columns are opened memory-mapped so a hit only touches the pages read.
+# Readers and writers take a per-ticker file lock, so every gunicorn worker
+# (and thread) can share one cache directory.
+class DiskCache:
+    def __init__(self, root=CACHE_DIR):
+        self.root = root
+
+    def _path(self, ticker, name=""):
+        return os.path.join(self.root, ticker.upper(), name)
+
+    # shared for reads, exclusive for writes; a no-op where fcntl is missing
+    @contextlib.contextmanager
+    def lock(self, ticker, exclusive=False):
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(self._path(ticker), exist_ok=True)
+        with open(self._path(ticker, ".lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def read(self, ticker):
+        with self.lock(ticker):
+            return self.read_unlocked(ticker)
+
+    def read_unlocked(self, ticker):
+        meta_file = self._path(ticker, "meta.json")
+        if not os.path.exists(meta_file):
+            return None
+        with open(meta_file) as f:
+            meta = json.load(f)
+        data = {"Date": pd.to_datetime(np.load(self._path(ticker, "Date.npy"), mmap_mode="r"))}
+        for column in meta["columns"]:
+            data[column] = np.load(self._path(ticker, column + ".npy"), mmap_mode="r")
+        return pd.DataFrame(data), meta
+
+    # callers hold lock(ticker, exclusive=True)
+    def write(self, ticker, df, start, end, absent=(), partial=()):
+        os.makedirs(self._path(ticker), exist_ok=True)
+        columns = [c for c in COLUMNS if c in df.columns]
+        self._save(ticker, "Date.npy", df["Date"].values.astype("datetime64[ns]"))
+        for column in columns:
+            self._save(ticker, column + ".npy", df[column].values.astype("float64"))
+        # meta goes last so a reader never sees a range the columns don't cover
+        self._save_meta(ticker, {
+            "columns": columns,
+            "start": start.strftime("%Y-%m-%d"),
+            "end": end.strftime("%Y-%m-%d"),
+            "absent": [[a.strftime("%Y-%m-%d"), b.strftime("%Y-%m-%d")] for a, b in absent],
+            "partial": [d.strftime("%Y-%m-%d") for d in partial],
+            "fetched_at": time.time(),
+        })
+
+    def _save(self, ticker, name, values):
+        tmp = self._path(ticker, name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, values)
+        os.replace(tmp, self._path(ticker, name))
+
+    def _save_meta(self, ticker, meta):
+        tmp = self._path(ticker, "meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._path(ticker, "meta.json"))
+
+
+disk_cache = DiskCache()
+
+
+def merge_frames(frames):
+    frames = [f for f in frames if f is not None and len(f)]
+    if not frames:
+        return pd.DataFrame(dict({"Date": pd.DatetimeIndex([])}, **{c: np.empty(0) for c in COLUMNS}))
+    df = pd.concat(frames, ignore_index=True, sort=False)
+    df = df.drop_duplicates(subset="Date", keep="last")
+    return df.sort_values("Date").reset_index(drop=True)
+
+
+def start_of_day(d):
+    return datetime.datetime(d.year, d.month, d.day)
+
+
+def slice_frame(df, start, end):
+    mask = (df["Date"] >= pd.Timestamp(start)) & (df["Date"] < pd.Timestamp(end) + ONE_DAY)
+    return df[mask].reset_index(drop=True)
+
+
+# Sessions upstream was asked for and had no bar for, as (first, last) runs
+def absent_sessions(meta):
+    runs = meta.get("absent", []) if meta else []
+    return pd.DatetimeIndex([]).append([trading_calendar.sessions(a, b) for a, b in runs])
+
+
+# Sessions whose held bar was fetched before that session's close. Caches
+# written before this was recorded trust nothing from their last day.
+def partial_sessions(meta):
+    if not meta:
+        return pd.DatetimeIndex([])
+    return pd.DatetimeIndex(meta.get("partial", [meta["end"]]))
+
+
+# Trading sessions of [start, end] to fetch, as (first, last) runs: every past
+# session with no final bar that upstream wasn't already found to lack, and
+# today's while it is still open and its bar has gone stale, or once it has
+# closed after a fetch made before the close. Dates are New York dates.
+# Weekends, holidays and final bars are never requested. Also returns the
+# covered range after fetching.
+def missing_ranges(meta, dates, start, end, now):
+    today = start_of_day(now)
+    last = min(end, today)
+    expected = trading_calendar.sessions(start, last)
+    wanted = expected[expected < pd.Timestamp(today)]
+    if meta is not None:
+        held = pd.DatetimeIndex(dates).normalize()
+        held = held[~held.isin(partial_sessions(meta))]
+        wanted = wanted[~wanted.isin(held) & ~wanted.isin(absent_sessions(meta))]
+    if len(expected) and expected[-1] == pd.Timestamp(today):
+        hi = datetime.datetime.strptime(meta["end"], "%Y-%m-%d") if meta else None
+        stale = meta is not None and (now.time() >= trading_calendar.CLOSE or
+                                      time.time() - meta["fetched_at"] > REFRESH_SECONDS)
+        if meta is None or hi < today or stale and pd.Timestamp(today) in partial_sessions(meta):
+            wanted = wanted.append(expected[-1:])
+    ranges = [(a.to_pydatetime(), b.to_pydatetime()) for a, b in trading_calendar.runs(wanted)]
+
+    if meta is None:
+        return ranges, start, last
+    lo = datetime.datetime.strptime(meta["start"], "%Y-%m-%d")
+    hi = datetime.datetime.strptime(meta["end"], "%Y-%m-%d")
+    return ranges, min(lo, start), max(hi, last)
+
+
+# Serve [start, end] from the disk cache, fetching only the missing ranges.
+# Fetches happen under the ticker's exclusive lock, so when several workers
+# miss at once the first one fetches and the others read its result. now is
+# the exchange's wall clock (trading_calendar.now() unless given).
+def load_cached(ticker, start, end, fetch, cache=None, now=None):
+    cache = cache or disk_cache
+    start, end = start_of_day(start), start_of_day(end)
+    now = now or trading_calendar.now()
+    today = pd.Timestamp(start_of_day(now))
+    entry = cache.read(ticker)
+    ranges, lo, hi = missing_ranges(entry and entry[1], entry and entry[0]["Date"], start, end, now)
+    if not ranges:
+        return slice_frame(entry[0] if entry else merge_frames([]), start, end)
+
+    with cache.lock(ticker, exclusive=True):
+        entry = cache.read_unlocked(ticker)
+        meta = entry and entry[1]
+        ranges, lo, hi = missing_ranges(meta, entry and entry[0]["Date"], start, end, now)
+        parts = [entry[0]] if entry else []
+        if ranges:
+            parts.extend(fetch(ticker, a, b) for a, b in ranges)
+            df = merge_frames(parts)
+            # past sessions asked for and still missing are not asked for again;
+            # a failed fetch raises above and records nothing
+            asked = pd.DatetimeIndex([]).append([trading_calendar.sessions(a, b) for a, b in ranges])
+            past = asked[asked < today]
+            absent = absent_sessions(meta).union(past[~past.isin(pd.DatetimeIndex(df["Date"]).normalize())])
+            # and a bar fetched before its session closed is fetched again after
+            partial = partial_sessions(meta)
+            partial = partial[~partial.isin(asked)]
+            if today in asked and now.time() < trading_calendar.CLOSE:
+                partial = partial.append(pd.DatetimeIndex([today]))
+            cache.write(ticker, df, lo, hi, trading_calendar.runs(absent), partial)
+        else:
+            df = parts[0] if parts else merge_frames([])
+    return slice_frame(df, start, end)
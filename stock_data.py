@@ -0,0 +1,107 @@
+import datetime
+import time
+
+import trading_calendar
+from compact_store import MEMORY_BUDGET, CompactFrame, CompactStore
+from data_source import get_source
+from shared_store import SHARED_STORE, SharedStore
+from stock_cache import REFRESH_SECONDS, load_cached
+
+# trailing windows behind the time buttons, in calendar days
+VIEW_DAYS = {"week": 7, "month": 30, "60d": 60, "90d": 90, "180d": 180, "year": 365}
+
+
+def parse_date(text):
+    return datetime.datetime(*list(map(int, text.split("/")))[::-1])
+
+
+# upstream provider, picked with STOCK_DATA_SOURCE (yahoo or fake)
+source = get_source()
+
+
+# Per-ticker bars covering the widest time view, held compactly (see
+# compact_store) under the process memory budget. Every time button is a
+# binary-search slice of them, so switching views never refetches. Tickers
+# in the shared store (see shared_store) are read from it instead and cost
+# this process no memory of its own.
+class FrameStore:
+    def __init__(self, fetch, days=max(VIEW_DAYS.values()), ttl=REFRESH_SECONDS, max_bytes=MEMORY_BUDGET,
+                 shared=None):
+        self.fetch = fetch
+        self.days = days
+        self.ttl = ttl
+        self.frames = CompactStore(max_bytes)
+        self.shared = shared
+        self.hits = self.misses = 0
+
+    def load(self, stock_name):
+        now = trading_calendar.now()
+        return load_cached(stock_name, now - datetime.timedelta(days=self.days), now, self.fetch)
+
+    def compact(self, stock_name):
+        frame = self.shared.get(stock_name) if self.shared is not None else None
+        if frame is not None:
+            self.hits += 1
+            return frame
+        entry = self.frames.get(stock_name)
+        if entry is None or time.time() - entry[1] > self.ttl:
+            self.misses += 1
+            entry = (CompactFrame.from_frame(self.load(stock_name)), time.time())
+            self.frames.put(stock_name, *entry)
+        else:
+            self.hits += 1
+        return entry[0]
+
+    # full frame indexed by date
+    def get(self, stock_name):
+        return self.compact(stock_name).to_frame().set_index("Date", drop=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.frames),
+            "bytes": self.frames.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.frames.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+    def view(self, stock_name, days):
+        frame = self.compact(stock_name)
+        return frame.to_frame(frame.searchsorted(trading_calendar.now() - datetime.timedelta(days=days)))
+
+
+frame_store = FrameStore(source, shared=SharedStore() if SHARED_STORE else None)
+
+
+def get_period_view(stock_name, days):
+    return frame_store.view(stock_name, days)
+
+
+def get_60d_view(stock_name):
+    return get_period_view(stock_name, days=VIEW_DAYS["60d"])
+
+
+def get_90d_view(stock_name):
+    return get_period_view(stock_name, days=VIEW_DAYS["90d"])
+
+
+def get_180d_view(stock_name):
+    return get_period_view(stock_name, days=VIEW_DAYS["180d"])
+
+
+def get_month_view(stock_name):
+    return get_period_view(stock_name, days=VIEW_DAYS["month"])
+
+
+def get_week_view(stock_name):
+    return get_period_view(stock_name, days=VIEW_DAYS["week"])
+
+
+def get_year_view(stock_name):
+    return get_period_view(stock_name, days=VIEW_DAYS["year"])
+
+
+def load_stock(stock_name, start='01/02/2019', end='5/9/2020'):
+    return load_cached(stock_name, parse_date(start), parse_date(end), source)
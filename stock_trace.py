@@ -1,23 +1,21 @@
-import plotly.graph_objs as go
-import pandas as pd
+from indicators import pipeline
+
+# Builders return plotly traces as plain dicts of the frame's and pipeline's
+# arrays: nothing goes through graph_objs validation on the way to a figure.
 
 
 # Moving average
 def moving_average_trace(df):
-    df2 = df.set_index('Date')
-    df2 = df2.rolling(window=5).mean()
-    trace = go.Scatter(
-        x=df["Date"], y=df2["Close"], mode="lines", showlegend=True, name="MA"
+    trace = dict(
+        type="scatter", x=df["Date"].values, y=pipeline(df).get("sma", 5), mode="lines", showlegend=True, name="MA"
     )
     return trace
 
 
 # Exponential moving average
 def e_moving_average_trace(df):
-    df2 = df.set_index('Date')
-    df2 = df2.rolling(window=20).mean()
-    trace = go.Scatter(
-        x=df["Date"], y=df2["Close"], mode="lines", showlegend=True, name="EMA"
+    trace = dict(
+        type="scatter", x=df["Date"].values, y=pipeline(df).get("sma", 20), mode="lines", showlegend=True, name="EMA"
     )
     return trace
 
@@ -26,74 +24,73 @@ def e_moving_average_trace(df):
 
 # Bollinger Bands
 def bollinger_trace(df, window_size=10, num_of_std=5):
-    price = df["Close"]
-    rolling_mean = price.rolling(window=window_size).mean()
-    rolling_std = price.rolling(window=window_size).std()
+    frame = pipeline(df)
+    rolling_mean = frame.get("sma", window_size)
+    rolling_std = frame.get("std", window_size)
     upper_band = rolling_mean + (rolling_std * num_of_std)
     lower_band = rolling_mean - (rolling_std * num_of_std)
 
-    trace = go.Scatter(
-        x=df["Date"], y=upper_band, mode="lines", showlegend=True, name="BB_upper"
+    trace = dict(
+        type="scatter", x=df["Date"].values, y=upper_band, mode="lines", showlegend=True, name="BB_upper"
     )
 
-    trace2 = go.Scatter(
-        x=df["Date"], y=rolling_mean, mode="lines", showlegend=True, name="BB_mean"
+    trace2 = dict(
+        type="scatter", x=df["Date"].values, y=rolling_mean, mode="lines", showlegend=True, name="BB_mean"
     )
 
-    trace3 = go.Scatter(
-        x=df["Date"], y=lower_band, mode="lines", showlegend=True, name="BB_lower"
+    trace3 = dict(
+        type="scatter", x=df["Date"].values, y=lower_band, mode="lines", showlegend=True, name="BB_lower"
     )
     return [trace, trace2, trace3]
 
 
 # Pivot points
 def pp_trace(df):
-    PP = pd.Series((df["High"] + df["Low"] + df["Close"]) / 3)
-    R1 = pd.Series(2 * PP - df["Low"])
-    S1 = pd.Series(2 * PP - df["High"])
-    R2 = pd.Series(PP + df["High"] - df["Low"])
-    S2 = pd.Series(PP - df["High"] + df["Low"])
-    R3 = pd.Series(df["High"] + 2 * (PP - df["Low"]))
-    S3 = pd.Series(df["Low"] - 2 * (df["High"] - PP))
-    trace = go.Scatter(x=df["Date"], y=PP, mode="lines", showlegend=True, name="Pivot points PP")
-    trace1 = go.Scatter(x=df["Date"], y=R1, mode="lines", showlegend=True, name="Pivot points R1")
-    trace2 = go.Scatter(x=df["Date"], y=S1, mode="lines", showlegend=True, name="Pivot points S1")
-    trace3 = go.Scatter(x=df["Date"], y=R2, mode="lines", showlegend=True, name="Pivot points R2")
-    trace4 = go.Scatter(x=df["Date"], y=S2, mode="lines", showlegend=True, name="Pivot points S2")
-    trace5 = go.Scatter(x=df["Date"], y=R3, mode="lines", showlegend=True, name="Pivot points R3")
-    trace6 = go.Scatter(x=df["Date"], y=S3, mode="lines", showlegend=True, name="Pivot points S3")
+    frame = pipeline(df)
+    high, low = frame.column("High"), frame.column("Low")
+    PP = frame.get("typical")
+    R1 = 2 * PP - low
+    S1 = 2 * PP - high
+    R2 = PP + high - low
+    S2 = PP - high + low
+    R3 = high + 2 * (PP - low)
+    S3 = low - 2 * (high - PP)
+    trace = dict(type="scatter", x=df["Date"].values, y=PP, mode="lines", showlegend=True, name="Pivot points PP")
+    trace1 = dict(type="scatter", x=df["Date"].values, y=R1, mode="lines", showlegend=True, name="Pivot points R1")
+    trace2 = dict(type="scatter", x=df["Date"].values, y=S1, mode="lines", showlegend=True, name="Pivot points S1")
+    trace3 = dict(type="scatter", x=df["Date"].values, y=R2, mode="lines", showlegend=True, name="Pivot points R2")
+    trace4 = dict(type="scatter", x=df["Date"].values, y=S2, mode="lines", showlegend=True, name="Pivot points S2")
+    trace5 = dict(type="scatter", x=df["Date"].values, y=R3, mode="lines", showlegend=True, name="Pivot points R3")
+    trace6 = dict(type="scatter", x=df["Date"].values, y=S3, mode="lines", showlegend=True, name="Pivot points S3")
     return trace, trace1, trace2, trace3, trace4, trace5, trace6
 
 
 # Volume Weighted Average Price
 def volume_weighted_average_price_trace(df, ndays=5):
-    TP = (df["High"] + df["Low"] + df["Close"]) / 3
-    PV = TP*df['Volume']
-
-    # 3 total price * volume
-    total_pv = PV.rolling(ndays, min_periods=1).sum()
-    # 4 total volume
-    total_volume = df['Volume'].rolling(ndays, min_periods=1).sum()
-    vwap = total_pv / total_volume
-    vwap_series = pd.Series(vwap, name="vwap")
-    trace = go.Scatter(x=df["Date"], y=vwap_series, mode="lines", showlegend=True, name="VWAP")
+    # rolling sum of typical price * volume over rolling sum of volume
+    vwap = pipeline(df).get("vwap", ndays)
+    trace = dict(type="scatter", x=df["Date"].values, y=vwap, mode="lines", showlegend=True, name="VWAP")
     return trace
 
 
 # Stochastic oscillator %K
 def stoc_trace(df):
-    SOk = pd.Series((df["Close"] - df["Low"]) / (df["High"] - df["Low"]), name="Stochastic oscillator")
-    trace = go.Scatter(x=df["Date"], y=SOk, mode="lines", showlegend=False, name="Stochastic oscillator")
+    frame = pipeline(df)
+    low = frame.column("Low")
+    SOk = (frame.column("Close") - low) / (frame.column("High") - low)
+    trace = dict(type="scatter", x=df["Date"].values, y=SOk, mode="lines", showlegend=False,
+                 name="Stochastic oscillator")
     return trace
 
 
 def candlestick_trace(df):
-    return go.Candlestick(
-        x=df["Date"],
-        open=df["Open"],
-        high=df["High"],
-        low=df["Low"],
-        close=df["Close"],
+    return dict(
+        type="candlestick",
+        x=df["Date"].values,
+        open=df["Open"].values,
+        high=df["High"].values,
+        low=df["Low"].values,
+        close=df["Close"].values,
         increasing=dict(line=dict(color="#00ff00")),
         decreasing=dict(line=dict(color="red")),
         showlegend=False,
@@ -102,36 +99,34 @@ def candlestick_trace(df):
 
 
 def scatter_trace(df):
-    return go.Scatter(
-        x=df["Date"],
-        y=df["Close"],
+    return dict(
+        type="scatter",
+        x=df["Date"].values,
+        y=df["Close"].values,
         name="scatter",
         mode='lines+markers'
     )
 
 
 def emasma_trace(df):
-    df1 = df.set_index('Date')
-    df1 = df1.rolling(window=5).mean()
-
-    df2 = df.set_index('Date')
-    df2 = df2.rolling(window=20).mean()
-
-    return go.Scatter(
-        x=df1["Close"],
-        y=df2["Close"],
+    frame = pipeline(df)
+    return dict(
+        type="scatter",
+        x=frame.get("sma", 5),
+        y=frame.get("sma", 20),
         name="scatter",
         mode='lines+markers',
-        hovertext=df['Date']
+        hovertext=df['Date'].values
     )
 
 
 
 def OHLC_trace(df):
-    return go.Ohlc(
-        x=df['Date'],
-        open=df['Open'],
-        high=df['High'],
-        low=df['Low'],
-        close=df['Close']
+    return dict(
+        type="ohlc",
+        x=df['Date'].values,
+        open=df['Open'].values,
+        high=df['High'].values,
+        low=df['Low'].values,
+        close=df['Close'].values
     )
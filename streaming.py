@@ -0,0 +1,169 @@
+import collections
+import math
+
+# bars of indicator values each streaming indicator keeps for charting
+HISTORY = 500
+# running sums are rebuilt from the window this often to stop float drift
+RESYNC_EVERY = 1024
+
+NAN = float("nan")
+
+
+# Indicator updated one bar at a time in constant time. A bar is anything
+# indexable by column name (dict, pandas row). value is the latest output and
+# history holds the last `history` outputs.
+class StreamingIndicator:
+    def __init__(self, history=HISTORY):
+        self.value = NAN
+        self.history = collections.deque(maxlen=history)
+
+    def update(self, bar):
+        self.value = self._update(bar)
+        self.history.append(self.value)
+        return self.value
+
+    def _update(self, bar):
+        raise NotImplementedError
+
+    def replay(self, df):
+        for bar in df.to_dict("records"):
+            self.update(bar)
+        return self
+
+
+# Simple moving average over a running sum
+class MovingAverage(StreamingIndicator):
+    def __init__(self, window=5, field="Close", history=HISTORY):
+        super().__init__(history)
+        self.window = window
+        self.field = field
+        self.values = collections.deque(maxlen=window)
+        self.total = 0.0
+        self.count = 0
+
+    def _update(self, bar):
+        x = float(bar[self.field])
+        if len(self.values) == self.window:
+            self.total -= self.values[0]
+        self.values.append(x)
+        self.total += x
+        self.count += 1
+        if self.count % RESYNC_EVERY == 0:
+            self.total = math.fsum(self.values)
+        return self.total / self.window if len(self.values) == self.window else NAN
+
+
+# Recursive exponential moving average, seeded with the first close
+class ExponentialMovingAverage(StreamingIndicator):
+    def __init__(self, span=20, field="Close", history=HISTORY):
+        super().__init__(history)
+        self.alpha = 2.0 / (span + 1)
+        self.field = field
+
+    def _update(self, bar):
+        x = float(bar[self.field])
+        if math.isnan(self.value):
+            return x
+        return self.value + self.alpha * (x - self.value)
+
+
+# Bollinger bands from a sliding-window Welford mean/variance; value is
+# (upper, mean, lower) with the sample std like the batch version.
+class BollingerBands(StreamingIndicator):
+    def __init__(self, window_size=10, num_of_std=5, field="Close", history=HISTORY):
+        super().__init__(history)
+        self.window = window_size
+        self.num_of_std = num_of_std
+        self.field = field
+        self.values = collections.deque(maxlen=window_size)
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.value = (NAN, NAN, NAN)
+
+    def _update(self, bar):
+        x = float(bar[self.field])
+        if len(self.values) == self.window:
+            old = self.values[0]
+            delta = x - old
+            old_mean = self.mean
+            self.mean += delta / self.window
+            self.m2 += delta * (x - self.mean + old - old_mean)
+        else:
+            n = len(self.values) + 1
+            delta = x - self.mean
+            self.mean += delta / n
+            self.m2 += delta * (x - self.mean)
+        self.values.append(x)
+        if len(self.values) < self.window or self.window < 2:
+            return NAN, NAN, NAN
+        band = math.sqrt(max(self.m2, 0.0) / (self.window - 1)) * self.num_of_std
+        return self.mean + band, self.mean, self.mean - band
+
+
+# Volume weighted average price over the last ndays bars
+class VolumeWeightedAveragePrice(StreamingIndicator):
+    def __init__(self, ndays=5, history=HISTORY):
+        super().__init__(history)
+        self.bars = collections.deque(maxlen=ndays)
+        self.total_pv = 0.0
+        self.total_volume = 0.0
+        self.count = 0
+
+    def _update(self, bar):
+        tp = (float(bar["High"]) + float(bar["Low"]) + float(bar["Close"])) / 3
+        pv, volume = tp * float(bar["Volume"]), float(bar["Volume"])
+        if len(self.bars) == self.bars.maxlen:
+            old_pv, old_volume = self.bars[0]
+            self.total_pv -= old_pv
+            self.total_volume -= old_volume
+        self.bars.append((pv, volume))
+        self.total_pv += pv
+        self.total_volume += volume
+        self.count += 1
+        if self.count % RESYNC_EVERY == 0:
+            self.total_pv = math.fsum(b[0] for b in self.bars)
+            self.total_volume = math.fsum(b[1] for b in self.bars)
+        return self.total_pv / self.total_volume if self.total_volume else NAN
+
+
+# Pivot points of the bar itself; value is (PP, R1, S1, R2, S2, R3, S3)
+class PivotPoints(StreamingIndicator):
+    def _update(self, bar):
+        high, low = float(bar["High"]), float(bar["Low"])
+        pp = (high + low + float(bar["Close"])) / 3
+        return (pp, 2 * pp - low, 2 * pp - high, pp + high - low, pp - high + low,
+                high + 2 * (pp - low), low - 2 * (high - pp))
+
+
+# Stochastic oscillator %K of the bar itself, as stoc_trace computes it
+class StochasticK(StreamingIndicator):
+    def _update(self, bar):
+        high, low = float(bar["High"]), float(bar["Low"])
+        return (float(bar["Close"]) - low) / (high - low) if high != low else NAN
+
+
+def default_indicators():
+    return {
+        "MA": MovingAverage(5),
+        "EMA": ExponentialMovingAverage(20),
+        "BB": BollingerBands(10, 5),
+        "VWAP": VolumeWeightedAveragePrice(5),
+        "K": StochasticK(),
+    }
+
+
+# Every streaming indicator of one ticker, fed the same bars
+class TickerIndicators:
+    def __init__(self, indicators=None):
+        self.indicators = indicators or default_indicators()
+
+    def update(self, bar):
+        return {name: indicator.update(bar) for name, indicator in self.indicators.items()}
+
+    def replay(self, df):
+        for bar in df.to_dict("records"):
+            self.update(bar)
+        return self
+
+    def values(self):
+        return {name: indicator.value for name, indicator in self.indicators.items()}
@@ -0,0 +1,140 @@
+import datetime
+import time
+
+import numpy as np
+import pandas as pd
+
+from backtest import BACKTEST_WORKERS, COST, SharedArray, _pool, backtest
+from indicators import PrefixSums
+from universe import UNIVERSE_TIMEOUT, Panel, read_universe
+
+# grid swept by default, covering the fixed 10 x 5 Bollinger and 5/20 MA windows
+WINDOWS = (5, 10, 15, 20, 30, 50)
+STDS = (1.0, 1.5, 2.0, 2.5, 3.0, 5.0)
+
+
+# Long from the first bar where entries holds until the first later bar where
+# exits holds, as one pass over axis 0: a bar is held when the latest entry
+# is more recent than the latest exit.
+def hold(entries, exits):
+    index = np.arange(len(entries)).reshape((-1,) + (1,) * (entries.ndim - 1))
+    last_entry = np.maximum.accumulate(np.where(entries, index, -1), axis=0)
+    last_exit = np.maximum.accumulate(np.where(exits, index, -1), axis=0)
+    return last_entry > last_exit
+
+
+# P&L of every (window, num_of_std) cell for a dates x tickers close array:
+# buy a close below the lower band, sell once it is back at the mean. The
+# prefix sums are built once, so each window is two subtractions and each
+# std multiplier one more comparison. Returns windows x stds x tickers.
+def _bollinger_grid(close, windows, stds, cost):
+    sums = PrefixSums(close)
+    grid = np.empty((len(windows), len(stds)) + close.shape[1:])
+    for i, window in enumerate(windows):
+        mean, std = sums.mean(window), sums.std(window)
+        exits = close >= mean
+        for j, num_of_std in enumerate(stds):
+            signal = hold(close < mean - std * num_of_std, exits)
+            grid[i, j] = backtest(close, signal, cost)["pnl"]
+    return grid
+
+
+# P&L of every window for a dates x tickers close array, long while the close
+# is above its moving average. Returns windows x tickers.
+def _moving_average_grid(close, windows, cost):
+    sums = PrefixSums(close)
+    return np.stack([backtest(close, close > sums.mean(window), cost)["pnl"] for window in windows])
+
+
+def _sweep_shard(path, windows, stds, cost):
+    close = np.asarray(np.load(path, mmap_mode="r"))
+    return _bollinger_grid(close, windows, stds, cost), _moving_average_grid(close, windows, cost)
+
+
+# Both grids for a dates x tickers close array, with the windows sharded over
+# the backtest process pool and the closes shared through a RAM-backed file
+def sweep(close, windows=WINDOWS, stds=STDS, cost=COST, workers=BACKTEST_WORKERS):
+    if workers <= 1 or len(windows) < 2:
+        return _bollinger_grid(close, windows, stds, cost), _moving_average_grid(close, windows, cost)
+
+    shared = SharedArray(np.ascontiguousarray(close))
+    try:
+        futures = [_pool().submit(_sweep_shard, shared.path, shard, stds, cost)
+                   for shard in np.array_split(np.asarray(windows), workers) if len(shard)]
+        shards = [future.result() for future in futures]
+    finally:
+        shared.close()
+    return np.concatenate([s[0] for s in shards]), np.concatenate([s[1] for s in shards])
+
+
+# Best parameters per ticker from the grids of sweep
+def best_params(tickers, bollinger, moving_average, windows=WINDOWS, stds=STDS):
+    flat = np.where(np.isnan(bollinger), -np.inf, bollinger).reshape(-1, len(tickers))
+    cell = flat.argmax(axis=0)
+    average = np.where(np.isnan(moving_average), -np.inf, moving_average).argmax(axis=0)
+    result = {}
+    for t, ticker in enumerate(tickers):
+        i, j = divmod(cell[t], len(stds))
+        result[ticker] = {
+            "Bollinger band": {"window_size": windows[i], "num_of_std": stds[j],
+                               "pnl": float(flat[cell[t], t])},
+            "Moving average": {"window": windows[average[t]],
+                               "pnl": float(moving_average[average[t], t])},
+        }
+    return result
+
+
+def optimize(panel, windows=WINDOWS, stds=STDS, cost=COST, workers=BACKTEST_WORKERS):
+    bollinger, moving_average = sweep(panel["Close"], windows, stds, cost, workers)
+    return best_params(panel.tickers, bollinger, moving_average, windows, stds)
+
+
+# One ticker's frame, as the rule builder and charts hold it
+def optimize_frame(ticker, df, windows=WINDOWS, stds=STDS, cost=COST):
+    close = df["Close"].values.astype("float64")[:, None]
+    bollinger, moving_average = sweep(close, windows, stds, cost, workers=1)
+    return best_params([ticker], bollinger, moving_average, windows, stds)[ticker]
+
+
+# The same Bollinger grid for one ticker by calling bollinger_trace per cell
+def _trace_loop(df, windows, stds, cost):
+    from stock_trace import bollinger_trace
+
+    close = df["Close"].values
+    grid = np.empty((len(windows), len(stds)))
+    for i, window in enumerate(windows):
+        for j, num_of_std in enumerate(stds):
+            _, mean, lower = [np.asarray(trace["y"], dtype="float64")
+                              for trace in bollinger_trace(df, window, num_of_std)]
+            signal = hold(close < lower, close >= mean)
+            grid[i, j] = backtest(close, signal, cost)["pnl"]
+    return grid
+
+
+if __name__ == "__main__":
+    end = datetime.datetime.now()
+    panel = Panel.load(read_universe(), end - datetime.timedelta(days=3 * 365), end, timeout=UNIVERSE_TIMEOUT)
+    if panel.missing:
+        print("%d tickers left out: %s" % (len(panel.missing), " ".join(panel.missing)))
+    cells = len(WINDOWS) * len(STDS)
+
+    ticker = panel.tickers[0]
+    df = pd.DataFrame({"Date": panel.dates, "Close": panel["Close"][:, 0]}).dropna().reset_index(drop=True)
+
+    t = time.time()
+    looped = _trace_loop(df, WINDOWS, STDS, COST)
+    loop_time = time.time() - t
+    t = time.time()
+    swept, _ = sweep(df["Close"].values[:, None], workers=1)
+    sweep_time = time.time() - t
+    assert np.allclose(looped, swept[:, :, 0], equal_nan=True)
+    print("%s, %d cells: bollinger_trace loop %.3fs, sweep %.3fs (%.0fx)"
+          % (ticker, cells, loop_time, sweep_time, loop_time / sweep_time))
+
+    for workers in (1, BACKTEST_WORKERS):
+        t = time.time()
+        best = optimize(panel, workers=workers)
+        elapsed = time.time() - t
+        print("%d tickers x %d cells, %d workers: %.2fs (%.0f ticker cells per second)"
+              % (len(panel.tickers), cells, workers, elapsed, len(panel.tickers) * cells / elapsed))
+    print(ticker, best[ticker])
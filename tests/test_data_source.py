@@ -0,0 +1,38 @@
+import time
+
+from data_source import BATCH_WORKERS, RateLimiter, load_batch
+
+
+def sleepy(seconds):
+    def load(ticker):
+        time.sleep(seconds)
+        return ticker
+    return load
+
+
+# tickers queued behind the pool's workers don't count down until they start
+def test_batch_timeout_is_per_ticker():
+    tickers = ["T%d" % i for i in range(10 * BATCH_WORKERS)]
+    results, errors = load_batch(sleepy(0.05), tickers, 0.2)
+    assert not errors
+    assert sorted(results) == sorted(tickers)
+
+
+def test_slow_ticker_times_out_alone():
+    def load(ticker):
+        time.sleep(1 if ticker == "SLOW" else 0.01)
+        return ticker
+
+    results, errors = load_batch(load, ["SLOW", "A", "B"], 0.2)
+    assert sorted(results) == ["A", "B"]
+    assert isinstance(errors["SLOW"], TimeoutError)
+
+
+# limiters on the same file (one per gunicorn worker) share one rate
+def test_rate_limit_shared_through_file(tmp_path):
+    path = str(tmp_path / "upstream.rate")
+    limiters = [RateLimiter(rate=20, burst=1, path=path) for _ in range(2)]
+    began = time.monotonic()
+    for i in range(6):
+        limiters[i % 2].acquire()
+    assert time.monotonic() - began >= 5 / 20 * 0.9
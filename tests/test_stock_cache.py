@@ -0,0 +1,86 @@
+import datetime
+
+import pandas as pd
+import pytest
+
+from data_source import empty_frame, synthetic_frame
+from stock_cache import DiskCache, load_cached, merge_frames
+
+START = datetime.datetime(2020, 1, 6)
+END = datetime.datetime(2020, 1, 10)
+
+
+class Recorder:
+    def __init__(self, frame=None):
+        self.frame = frame
+        self.calls = []
+
+    def __call__(self, ticker, start, end):
+        self.calls.append((start, end))
+        if self.frame is None:
+            return empty_frame()
+        return self.frame[(self.frame["Date"] >= start) & (self.frame["Date"] <= end)]
+
+
+def test_merge_frames_empty_has_datetime_dates():
+    assert merge_frames([]).dtypes["Date"].kind == "M"
+    assert merge_frames([empty_frame()]).dtypes["Date"].kind == "M"
+
+
+# BRK.B style: the first fetch for a ticker returns nothing
+def test_empty_first_fetch(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    fetch = Recorder()
+    df = load_cached("BRK.B", START, END, fetch, cache)
+    assert len(df) == 0
+    assert fetch.calls == [(START, END)]
+
+    # the sessions upstream had no bars for are not asked for again
+    assert len(load_cached("BRK.B", START, END, fetch, cache)) == 0
+    assert len(fetch.calls) == 1
+
+
+def test_fetches_only_missing_sessions(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    frame = synthetic_frame("SYN", pd.bdate_range(START, END + datetime.timedelta(days=7)))
+    fetch = Recorder(frame)
+    assert len(load_cached("SYN", START, END, fetch, cache)) == 5
+
+    later = END + datetime.timedelta(days=7)
+    assert len(load_cached("SYN", START, later, fetch, cache)) == 10
+    assert fetch.calls[-1] == (datetime.datetime(2020, 1, 13), later)
+
+
+# a failed fetch (connection error, 429, 5xx) must not mark sessions absent
+def test_failed_fetch_is_retried(tmp_path):
+    cache = DiskCache(str(tmp_path))
+
+    def failing(ticker, start, end):
+        raise IOError("503 Service Unavailable")
+
+    with pytest.raises(IOError):
+        load_cached("SYN", START, END, failing, cache)
+    fetch = Recorder(synthetic_frame("SYN", pd.bdate_range(START, END)))
+    assert len(load_cached("SYN", START, END, fetch, cache)) == 5
+    assert fetch.calls == [(START, END)]
+
+
+# today's bar is refetched once the session has closed, and a bar fetched
+# before the close is fetched again on a later day
+def test_partial_session_refetched_after_close(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    monday = datetime.datetime(2020, 1, 13)
+    fetch = Recorder(synthetic_frame("SYN", pd.bdate_range(START, monday)))
+
+    load_cached("SYN", START, END, fetch, cache, now=datetime.datetime(2020, 1, 10, 12))
+    load_cached("SYN", START, END, fetch, cache, now=datetime.datetime(2020, 1, 10, 12, 30))
+    assert fetch.calls == [(START, END)]
+    load_cached("SYN", START, END, fetch, cache, now=datetime.datetime(2020, 1, 10, 16, 30))
+    load_cached("SYN", START, END, fetch, cache, now=datetime.datetime(2020, 1, 10, 17))
+    assert fetch.calls[1:] == [(END, END)]
+
+    fetch.calls = []
+    cache = DiskCache(str(tmp_path / "other"))
+    load_cached("SYN", START, END, fetch, cache, now=datetime.datetime(2020, 1, 10, 12))
+    load_cached("SYN", START, monday, fetch, cache, now=datetime.datetime(2020, 1, 13, 9))
+    assert fetch.calls == [(START, END), (END, monday)]
@@ -0,0 +1,65 @@
+import datetime
+import os
+import time
+import zlib
+
+import numpy as np
+
+# seconds between simulated bars
+SIMULATED_INTERVAL = float(os.environ.get("STOCK_TICK_INTERVAL", 2))
+# most bars a single poll returns, so a long pause can't flood a chart
+MAX_BARS_PER_POLL = 100
+
+
+# Source of live bars. poll(ticker, last) returns the bars newer than `last`
+# (the most recent bar the caller holds, or None) as dicts with Date, Open,
+# High, Low, Close and Volume, oldest first.
+class TickFeed:
+    name = None
+
+    def poll(self, ticker, last):
+        raise NotImplementedError
+
+
+# Random walk continuing from the caller's last bar, one bar per interval of
+# wall time, so live charts can be exercised without a market data feed. Bars
+# sit on a fixed time grid so every worker process agrees on their dates.
+class SimulatedFeed(TickFeed):
+    name = "simulated"
+
+    def __init__(self, interval=SIMULATED_INTERVAL, volatility=0.002):
+        self.interval = interval
+        self.volatility = volatility
+
+    def poll(self, ticker, last):
+        now = int(time.time() // self.interval)
+        if last is None or now - last["Date"].timestamp() // self.interval > MAX_BARS_PER_POLL:
+            first, close = now, last["Close"] if last else 100.0
+        else:
+            first, close = int(last["Date"].timestamp() // self.interval) + 1, last["Close"]
+        count = now - first + 1
+        if count <= 0:
+            return []
+
+        rng = np.random.RandomState(zlib.crc32(("%s%s" % (ticker, first)).encode()))
+        closes = close * np.exp(np.cumsum(rng.normal(0, self.volatility, count)))
+        opens = np.concatenate(([close], closes[:-1]))
+        spread = np.abs(rng.normal(0, self.volatility, (2, count)))
+        bars = []
+        for i in range(count):
+            bars.append({
+                "Date": datetime.datetime.fromtimestamp((first + i) * self.interval),
+                "Open": float(opens[i]),
+                "High": float(max(opens[i], closes[i]) * (1 + spread[0, i])),
+                "Low": float(min(opens[i], closes[i]) * (1 - spread[1, i])),
+                "Close": float(closes[i]),
+                "Volume": float(rng.randint(1000, 100000)),
+            })
+        return bars
+
+
+FEEDS = {"simulated": SimulatedFeed}
+
+
+def get_feed(name=None):
+    return FEEDS[name or os.environ.get("STOCK_TICK_FEED", "simulated")]()
@@ -0,0 +1,69 @@
+import datetime
+import functools
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.holiday import (AbstractHolidayCalendar, GoodFriday, Holiday, USLaborDay,
+                                    USMartinLutherKingJr, USMemorialDay, USPresidentsDay,
+                                    USThanksgivingDay, nearest_workday, sunday_to_monday)
+
+TIMEZONE = "America/New_York"
+# regular close; a bar fetched before it may still change
+CLOSE = datetime.time(16, 0)
+
+
+# NYSE full-day holidays. New Year's Day falling on a Saturday is not moved
+# to the Friday before, the others move to the nearest weekday.
+class NYSECalendar(AbstractHolidayCalendar):
+    rules = [
+        Holiday("New Years Day", month=1, day=1, observance=sunday_to_monday),
+        USMartinLutherKingJr,
+        USPresidentsDay,
+        GoodFriday,
+        USMemorialDay,
+        Holiday("Juneteenth", month=6, day=19, start_date="2022-06-19", observance=nearest_workday),
+        Holiday("Independence Day", month=7, day=4, observance=nearest_workday),
+        USLaborDay,
+        USThanksgivingDay,
+        Holiday("Christmas", month=12, day=25, observance=nearest_workday),
+    ]
+
+
+# one-off closures (September 11, national days of mourning, Hurricane Sandy)
+SPECIAL_CLOSURES = pd.DatetimeIndex([
+    "2001-09-11", "2001-09-12", "2001-09-13", "2001-09-14", "2004-06-11", "2007-01-02",
+    "2012-10-29", "2012-10-30", "2018-12-05", "2025-01-09",
+])
+
+
+@functools.lru_cache(maxsize=None)
+def _year(year):
+    days = pd.bdate_range("%d-01-01" % year, "%d-12-31" % year)
+    closed = NYSECalendar().holidays("%d-01-01" % year, "%d-12-31" % year).union(SPECIAL_CLOSURES)
+    return days[~days.isin(closed)]
+
+
+# Trading sessions from start to end inclusive, as midnight timestamps
+def sessions(start, end):
+    start, end = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize()
+    if end < start:
+        return pd.DatetimeIndex([])
+    days = _year(start.year).append([_year(y) for y in range(start.year + 1, end.year + 1)])
+    return days[(days >= start) & (days <= end)]
+
+
+# Sessions grouped into runs with no session between them, as (first, last)
+# pairs: the fewest fetches that cover all of them and nothing else
+def runs(dates):
+    dates = pd.DatetimeIndex(dates).normalize().sort_values()
+    if not len(dates):
+        return []
+    every = sessions(dates[0], dates[-1])
+    positions = every.searchsorted(dates)
+    breaks = np.flatnonzero(np.diff(positions) > 1) + 1
+    return [(dates[run[0]], dates[run[-1]]) for run in np.split(np.arange(len(dates)), breaks)]
+
+
+# wall clock at the exchange, as a naive datetime
+def now():
+    return pd.Timestamp.now(tz=TIMEZONE).tz_localize(None).to_pydatetime()
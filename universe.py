@@ -0,0 +1,157 @@
+import datetime
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_source import BATCH_TIMEOUT, BATCH_WORKERS, UPSTREAM_RATE, load_batch
+from indicators import rolling_mean, rolling_std, rolling_sum
+from stock_cache import load_cached
+import stock_data
+
+FIELDS = ["Open", "High", "Low", "Close", "Volume"]
+SNP500 = os.path.join(os.path.dirname(os.path.abspath(__file__)), "snp500.csv")
+# per-ticker timeout when loading the whole universe: on a cold cache every
+# load also waits its turn at the upstream rate limit behind the other workers
+UNIVERSE_TIMEOUT = float(os.environ.get("UNIVERSE_TIMEOUT", BATCH_TIMEOUT + BATCH_WORKERS / UPSTREAM_RATE))
+
+
+def read_universe(path=SNP500, sector=None):
+    stocks = pd.read_csv(path)
+    if sector:
+        stocks = stocks[stocks["Sector"] == sector]
+    return list(stocks["Symbol"])
+
+
+# The whole universe as one dates x tickers float array per field, aligned on
+# the union of trading dates (NaN where a ticker has no bar). Every indicator
+# is a single vectorized pass over axis 0 instead of a loop over tickers.
+# missing lists the tickers load() was asked for and couldn't fill, failed
+# the ones among them whose load raised or timed out rather than had no bars.
+class Panel:
+    def __init__(self, dates, tickers, fields, missing=(), failed=()):
+        self.dates = dates
+        self.tickers = list(tickers)
+        self.fields = fields
+        self.missing = list(missing)
+        self.failed = list(failed)
+
+    @classmethod
+    def from_frames(cls, frames, fields=FIELDS):
+        tickers = sorted(frames)
+        if not tickers:
+            return cls(pd.DatetimeIndex([]), [], {f: np.empty((0, 0)) for f in fields})
+        # one outer-join concat, then split the (ticker, field) columns apart
+        joined = pd.concat([frames[t].set_index("Date")[fields] for t in tickers], axis=1, sort=True)
+        values = joined.values.astype("float64").reshape(len(joined), len(tickers), len(fields))
+        arrays = {f: np.ascontiguousarray(values[:, :, i]) for i, f in enumerate(fields)}
+        return cls(pd.DatetimeIndex(joined.index), tickers, arrays)
+
+    @classmethod
+    def load(cls, tickers, start, end, fetch=None, timeout=BATCH_TIMEOUT):
+        fetch = fetch or stock_data.source
+        frames, errors = load_batch(lambda t: load_cached(t, start, end, fetch), tickers, timeout)
+        panel = cls.from_frames({t: df for t, df in frames.items() if len(df)})
+        # failed, timed out or without a single bar
+        panel.missing = sorted(set(tickers) - set(panel.tickers))
+        panel.failed = sorted(errors)
+        return panel
+
+    def __getitem__(self, field):
+        return self.fields[field]
+
+    def rolling_mean(self, window, field="Close"):
+        return rolling_mean(self[field], window)
+
+    def rolling_std(self, window, field="Close"):
+        return rolling_std(self[field], window)
+
+    def bollinger(self, window_size=10, num_of_std=5):
+        mean = self.rolling_mean(window_size)
+        std = self.rolling_std(window_size)
+        return mean + std * num_of_std, mean, mean - std * num_of_std
+
+    def typical_price(self):
+        return (self["High"] + self["Low"] + self["Close"]) / 3
+
+    def vwap(self, ndays=5):
+        volume = self["Volume"]
+        return rolling_sum(self.typical_price() * volume, ndays, 1) / rolling_sum(volume, ndays, 1)
+
+    def pivot_points(self):
+        high, low = self["High"], self["Low"]
+        pp = self.typical_price()
+        return {
+            "PP": pp,
+            "R1": 2 * pp - low,
+            "S1": 2 * pp - high,
+            "R2": pp + high - low,
+            "S2": pp - high + low,
+            "R3": high + 2 * (pp - low),
+            "S3": low - 2 * (high - pp),
+        }
+
+    def stochastic_k(self):
+        low = self["Low"]
+        return (self["Close"] - low) / (self["High"] - low)
+
+    # latest non-NaN value of a dates x tickers array, per ticker
+    def latest(self, values):
+        filled = ~np.isnan(values)
+        last = len(values) - 1 - np.argmax(filled[::-1], axis=0)
+        result = values[last, np.arange(values.shape[1])]
+        result[~filled.any(axis=0)] = np.nan
+        return result
+
+
+# Same indicators one ticker at a time with pandas, as the trace builders did
+def per_ticker(frames):
+    result = {}
+    for ticker, df in frames.items():
+        price = df["Close"]
+        mean = price.rolling(window=10).mean()
+        std = price.rolling(window=10).std()
+        tp = (df["High"] + df["Low"] + df["Close"]) / 3
+        result[ticker] = {
+            "bb_upper": mean + std * 5,
+            "bb_lower": mean - std * 5,
+            "vwap": (tp * df["Volume"]).rolling(5, min_periods=1).sum()
+                    / df["Volume"].rolling(5, min_periods=1).sum(),
+            "R1": 2 * tp - df["Low"],
+            "S1": 2 * tp - df["High"],
+            "K": (df["Close"] - df["Low"]) / (df["High"] - df["Low"]),
+        }
+    return result
+
+
+def universe_pass(panel):
+    upper, mean, lower = panel.bollinger()
+    return upper, lower, panel.vwap(), panel.pivot_points(), panel.stochastic_k()
+
+
+if __name__ == '__main__':
+    # python universe.py [tickers] [days]: per-ticker pandas vs one panel pass
+    from data_source import FakeSource
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 5 * 365
+    end = datetime.datetime(2020, 1, 1)
+    source = FakeSource()
+    frames = {t: source(t, end - datetime.timedelta(days=days), end) for t in read_universe()[:count]}
+
+    began = time.time()
+    per_ticker(frames)
+    loop = time.time() - began
+
+    began = time.time()
+    panel = Panel.from_frames(frames)
+    build = time.time() - began
+    began = time.time()
+    universe_pass(panel)
+    vectorized = time.time() - began
+
+    print("%d tickers x %d bars" % (len(panel.tickers), len(panel.dates)))
+    print("per-ticker pandas: %.3fs" % loop)
+    print("panel build:       %.3fs" % build)
+    print("panel indicators:  %.3fs (%.1fx)" % (vectorized, loop / vectorized))
@@ -0,0 +1,135 @@
+import collections
+import heapq
+import itertools
+import os
+import threading
+import time
+
+from flask import jsonify
+
+from data_source import RateLimiter
+from stock_cache import REFRESH_SECONDS
+from universe import read_universe
+
+WARMUP_ENABLED = os.environ.get("WARMUP", "1") != "0"
+WARMUP_WORKERS = int(os.environ.get("WARMUP_WORKERS", 2))
+# tickers warmed per second, kept well under the upstream limit so
+# interactive fetches still get through
+WARMUP_RATE = float(os.environ.get("WARMUP_RATE", 1))
+# how many of the most viewed tickers each round covers
+WARMUP_TOP = int(os.environ.get("WARMUP_TOP", 20))
+# also warm every ticker of snp500.csv, last
+WARMUP_UNIVERSE = os.environ.get("WARMUP_UNIVERSE", "0") == "1"
+WARMUP_INTERVAL = float(os.environ.get("WARMUP_INTERVAL", REFRESH_SECONDS))
+
+# lower runs first
+DEFAULT, POPULAR, UNIVERSE = 0, 1, 2
+PRIORITY_NAMES = {DEFAULT: "default", POPULAR: "popular", UNIVERSE: "universe"}
+
+
+# Background warm-up of the caches a ticker's first view would otherwise fill
+# inside a user-facing callback. Every WARMUP_INTERVAL seconds a round queues
+# the default tickers, then the most viewed ones, then optionally the whole
+# universe; worker threads take them in priority order under a rate limit and
+# call warm(ticker). Nothing starts until start() is called: post-fork in
+# each gunicorn worker, or on the server's first request.
+class Prewarmer:
+    def __init__(self, warm, defaults, workers=WARMUP_WORKERS, rate=WARMUP_RATE, top=WARMUP_TOP,
+                 universe=WARMUP_UNIVERSE, interval=WARMUP_INTERVAL):
+        self.warm = warm
+        self.defaults = list(defaults)
+        self.workers = workers
+        self.limiter = RateLimiter(rate, burst=max(workers, 1)) if rate else None
+        self.top = top
+        self.universe = universe
+        self.interval = interval
+
+        self.views = collections.Counter()
+        self.queue = []
+        self.queued = set()
+        self.order = itertools.count()
+        self.cond = threading.Condition()
+        self.started = None
+        self.rounds = 0
+        self.running = set()
+        self.done = collections.Counter()
+        self.failed = collections.Counter()
+        self.last_error = None
+
+    # called by callbacks, ranks tickers for the next round
+    def viewed(self, ticker):
+        self.views[ticker] += 1
+
+    def enqueue(self, tickers, priority):
+        with self.cond:
+            for ticker in tickers:
+                if ticker not in self.queued and ticker not in self.running:
+                    heapq.heappush(self.queue, (priority, next(self.order), ticker))
+                    self.queued.add(ticker)
+            self.cond.notify_all()
+
+    def schedule(self):
+        self.rounds += 1
+        self.enqueue(self.defaults, DEFAULT)
+        self.enqueue([t for t, _ in self.views.most_common(self.top)], POPULAR)
+        if self.universe:
+            self.enqueue(read_universe(), UNIVERSE)
+
+    def start(self):
+        with self.cond:
+            if self.started is not None:
+                return
+            self.started = time.time()
+        for i in range(self.workers):
+            threading.Thread(target=self._work, name="warmup-%d" % i, daemon=True).start()
+        threading.Thread(target=self._schedule_loop, name="warmup-scheduler", daemon=True).start()
+
+    def _schedule_loop(self):
+        while True:
+            self.schedule()
+            time.sleep(self.interval)
+
+    def _work(self):
+        while True:
+            with self.cond:
+                while not self.queue:
+                    self.cond.wait()
+                priority, _, ticker = heapq.heappop(self.queue)
+                self.queued.discard(ticker)
+                self.running.add(ticker)
+            try:
+                if self.limiter:
+                    self.limiter.acquire()
+                self.warm(ticker)
+                self.done[PRIORITY_NAMES[priority]] += 1
+            except Exception as e:
+                self.failed[PRIORITY_NAMES[priority]] += 1
+                self.last_error = "%s: %s" % (ticker, e)
+            finally:
+                with self.cond:
+                    self.running.discard(ticker)
+
+    def status(self):
+        with self.cond:
+            pending = collections.Counter(PRIORITY_NAMES[p] for p, _, _ in self.queue)
+            return {
+                "enabled": self.started is not None,
+                "started": self.started,
+                "rounds": self.rounds,
+                "workers": self.workers,
+                "queued": dict(pending),
+                "running": sorted(self.running),
+                "done": dict(self.done),
+                "failed": dict(self.failed),
+                "last_error": self.last_error,
+                "most_viewed": self.views.most_common(self.top),
+            }
+
+
+def register(server, warmer, route="/warmup", enabled=WARMUP_ENABLED):
+    if enabled:
+        @server.before_request
+        def start_warmup():
+            warmer.start()
+
+    server.add_url_rule(route, "warmup", lambda: jsonify(warmer.status()))